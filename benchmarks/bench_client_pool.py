@@ -0,0 +1,104 @@
+"""
+Per-call overhead of the Gemini client setups under concurrent pruning calls, against a local HTTP stand-in server
+that answers generateContent like the Gemini API (no network or API key needed).
+
+Three setups are compared, each running --pipelines concurrent workers of --calls calls:
+    per-call: a new genai.Client for every call (a fresh connection and SSL context every time)
+    per-pipeline: one genai.Client per worker, as before client_pool.py (one pool per pipeline)
+    pooled: the process-wide client of get_genai_client shared by every worker
+
+The stand-in speaks plain HTTP/1.1 with keep-alive, so TLS handshakes are not part of the measured savings; against
+the real endpoint every new connection additionally pays a TLS handshake.
+
+Usage:
+    python benchmarks/bench_client_pool.py --pipelines 8 --calls 20 --serverLatency 0.01
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from google import genai
+from google.genai import types
+from utils.llm_utils.client_pool import get_genai_client, close_genai_clients
+
+RESPONSE = json.dumps({
+    "candidates": [{"content": {"role": "model", "parts": [{"text": '{"selected_ids": ["1"]}'}]}}],
+    "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 10, "totalTokenCount": 110},
+}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    connections = set()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            self.connections.add(self.client_address)
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def call(client):
+    client.models.generate_content(model="gemini-2.0-flash", contents="Select the relevant ids")
+
+
+def run_setup(setup: str, baseUrl: str, pipelines: int, calls: int) -> float:
+    settings = {"base_url": baseUrl}
+
+    def new_client():
+        return genai.Client(api_key="bench", http_options=types.HttpOptions(base_url=baseUrl))
+
+    def worker(_):
+        if setup == "per-call":
+            for _ in range(calls):
+                call(new_client())
+        else:
+            client = new_client() if setup == "per-pipeline" else get_genai_client("bench", settings)
+            for _ in range(calls):
+                call(client)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=pipelines) as executor:
+        list(executor.map(worker, range(pipelines)))
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pooled versus per-pipeline Gemini clients")
+    parser.add_argument("--pipelines", type=int, default=8, help="Concurrent pipelines")
+    parser.add_argument("--calls", type=int, default=20, help="Calls per pipeline")
+    parser.add_argument("--serverLatency", type=float, default=0.0, help="Seconds the stand-in waits per response")
+    args = parser.parse_args()
+
+    StandInHandler.latency = args.serverLatency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    baseUrl = f"http://127.0.0.1:{server.server_address[1]}/"
+    total = args.pipelines * args.calls
+
+    run_setup("pooled", baseUrl, 1, 1)  # warm up imports and the first connection
+    close_genai_clients()
+    print(f"{'setup':<14} {'total (s)':>10} {'per call (ms)':>14} {'connections':>12}")
+    for setup in ("per-call", "per-pipeline", "pooled"):
+        StandInHandler.connections.clear()
+        elapsed = run_setup(setup, baseUrl, args.pipelines, args.calls)
+        print(f"{setup:<14} {elapsed:>10.2f} {elapsed / total * 1000:>14.2f} {len(StandInHandler.connections):>12}")
+    close_genai_clients()
+    server.shutdown()
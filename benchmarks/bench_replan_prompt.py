@@ -0,0 +1,62 @@
+"""
+Size of the replanning prompt with the verbose tree context versus the compact context of build_replan_context.
+
+Every instance and part is kept unless a pruned json (as printed by pipeline.py as keptIDs) is given.
+
+Usage:
+    python benchmarks/bench_replan_prompt.py --sgPath <scene_graph.json> [<scene_graph.json> ...] [--prunedJson kept.json]
+"""
+import argparse
+import ast
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import sg_utils
+from utils.traversal import iter_nodes
+from utils.llm_utils.gemini_message import task_replanning
+from pipeline import Pipeline
+
+PLAN = "1. Navigate to the object.\n2. Operate the part.\nPlan complete."
+
+
+def prompt_chars(msg) -> int:
+    return sum(len(part["text"]) for content in msg for part in content["parts"])
+
+
+def measure(sgPath, prunedJson=None):
+    pipeline = Pipeline.__new__(Pipeline)
+    pipeline.sceneGraphDatabase = sg_utils.SceneGraphDatabase()
+    pipeline.sceneGraphDatabase.load_from_stream(sgPath, 1)
+    if prunedJson is None:
+        instanceNodes = pipeline.sceneGraphDatabase.instanceNodes
+        for node, _, _ in iter_nodes(instanceNodes.values()):
+            node.keptSG = list(node.partNodes)
+        pipeline.keptSG = list(instanceNodes)
+    else:
+        pipeline.apply_pruned_json(prunedJson)
+    pipeline.sceneGraphDatabase.add_kinematic_relations_from_stream(sgPath, pipeline.keptSG)
+    sizes = {}
+    for label, kwargs in (("tree, indented", {"contextFormat": "tree"}),
+                          ("tree, compact json", {"contextFormat": "tree", "compact": True}),
+                          ("compact context", {"contextFormat": "compact"})):
+        msg = task_replanning(pipeline.keptSG, pipeline.sceneGraphDatabase, "task", PLAN, **kwargs)
+        sizes[label] = prompt_chars(msg)
+    return sizes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare replanning prompt sizes")
+    parser.add_argument("--sgPath", nargs="+", required=True, help="Scene graph JSON files with kinematic relations")
+    parser.add_argument("--prunedJson", type=str, default=None, help="File with a pruned json to keep instead of everything")
+    args = parser.parse_args()
+    prunedJson = None
+    if args.prunedJson:
+        with open(args.prunedJson, 'r', encoding='utf-8') as f:
+            prunedJson = ast.literal_eval(f.read())
+    for sgPath in args.sgPath:
+        sizes = measure(sgPath, prunedJson)
+        baseline = sizes["tree, indented"]
+        print(sgPath)
+        for label, size in sizes.items():
+            print(f"  {label:<20} {size:>10} chars (~{size // 4} tokens) {size / baseline:7.1%}")
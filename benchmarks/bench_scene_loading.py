@@ -0,0 +1,47 @@
+"""
+Peak memory of loading a scene graph with json.load versus the streaming loader.
+
+Usage:
+    python benchmarks/bench_scene_loading.py --sgPath <scene_graph.json>
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import sg_utils
+
+
+def load_with_json(sgPath):
+    with open(sgPath, 'r') as f:
+        sceneGraph = json.load(f)
+    return sg_utils.SceneGraphDatabase(sceneGraph)
+
+
+def load_with_stream(sgPath):
+    sceneGraphDatabase = sg_utils.SceneGraphDatabase()
+    sceneGraphDatabase.load_from_stream(sgPath, 1)
+    return sceneGraphDatabase
+
+
+def measure(loader, sgPath):
+    tracemalloc.start()
+    start = time.perf_counter()
+    sceneGraphDatabase = loader(sgPath)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sceneGraphDatabase
+    return elapsed, current, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare scene graph loaders")
+    parser.add_argument("--sgPath", type=str, required=True, help="Path to the scene graph JSON file")
+    args = parser.parse_args()
+    for name, loader in (("json.load", load_with_json), ("stream", load_with_stream)):
+        elapsed, current, peak = measure(loader, args.sgPath)
+        print(f"{name:>10}: {elapsed:.3f}s, retained {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB")
@@ -0,0 +1,84 @@
+"""
+Timings of the tree walks built on utils/traversal.py over deep and bushy synthetic part hierarchies.
+The deep chain is far beyond the default recursion limit, which the former recursive walks could not handle.
+
+Usage:
+    python benchmarks/bench_traversal.py --depth 20000 --fanout 4 --bushyDepth 7
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import sg_utils
+from utils.traversal import walk, json_children, iter_nodes, POST_ORDER
+from utils.llm_utils.gemini_message import recursive_add_item
+from pipeline import Pipeline
+
+
+def deep_chain(depth):
+    root = {"id": "0", "instance description": {"name": "chain"}, "children": [], "kinematic_relations": []}
+    current = root
+    for level in range(1, depth):
+        child = {"id": f"p{level}", "kaf_name": "link", "children": [], "kinematic_relations": []}
+        current["children"].append(child)
+        current = child
+    return root
+
+
+def bushy_tree(depth, fanout):
+    root = {"id": "0", "instance description": {"name": "bush"}, "children": [], "kinematic_relations": []}
+    frontier = [root]
+    for level in range(1, depth):
+        nextFrontier = []
+        for parent in frontier:
+            for index in range(fanout):
+                child = {"id": f"{parent['id']}/{index}", "kaf_name": "part", "children": [], "kinematic_relations": []}
+                parent["children"].append(child)
+                nextFrontier.append(child)
+            parent["kinematic_relations"].append({
+                "subject": parent["children"][0]["id"],
+                "object": parent["children"][1 % fanout]["id"],
+                "joint_type": "revolute",
+            })
+        frontier = nextFrontier
+    return root
+
+
+def keep_everything(node):
+    for current, _, _ in iter_nodes([node]):
+        current.keptSG = list(current.partNodes)
+
+
+def timed(label, count, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<34} {elapsed * 1000:9.1f} ms  {elapsed / count * 1e6:7.2f} us/node")
+    return result
+
+
+def run(name, tree):
+    count = sum(1 for _ in walk([tree], json_children))
+    print(f"{name}: {count} nodes")
+    timed("constructor without kinematic", count, lambda: sg_utils.recursive_tree_constructor_without_kinematic(tree, ""))
+    timed("constructor with kinematic", count, lambda: sg_utils.recursive_tree_constructor_with_kinematic(tree, ""))
+    node = sg_utils.recursive_tree_constructor_without_kinematic(tree, "")
+    keep_everything(node)
+    timed("add kinematic", count, lambda: sg_utils.recursive_tree_constructor_add_kinematic(tree, node))
+    timed("pre-order kept walk", count, lambda: sum(1 for _ in iter_nodes([node], keptOnly=True)))
+    timed("post-order kept walk", count, lambda: sum(1 for _ in iter_nodes([node], POST_ORDER, keptOnly=True)))
+    pipeline = Pipeline.__new__(Pipeline)
+    timed("build_pruned_json", count, lambda: pipeline.build_pruned_json(node))
+    timed("recursive_add_item", count, lambda: recursive_add_item(node))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the iterative tree walks")
+    parser.add_argument("--depth", type=int, default=20000, help="Depth of the synthetic chain")
+    parser.add_argument("--fanout", type=int, default=4, help="Fan-out of the synthetic bushy tree")
+    parser.add_argument("--bushyDepth", type=int, default=7, help="Depth of the synthetic bushy tree")
+    args = parser.parse_args()
+    run("deep chain", deep_chain(args.depth))
+    run("bushy tree", bushy_tree(args.bushyDepth, args.fanout))
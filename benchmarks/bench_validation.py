@@ -0,0 +1,43 @@
+"""
+Time of the vectorized scene validation and statistics over a dataset, split into streaming/flattening the JSON and
+the NumPy checks themselves.
+
+Usage:
+    python benchmarks/bench_validation.py --datasetDir <dataset_dir> [--fileName scene_graph.json]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocess_dataset import find_scene_graphs
+from utils.sg_validation import scene_arrays_from_json, validate_scene_arrays, scene_statistics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scene validation pass over a dataset")
+    parser.add_argument("--datasetDir", type=str, required=True, help="Directory searched recursively for scene graph files")
+    parser.add_argument("--fileName", type=str, default="scene_graph.json", help="Name of the scene graph files")
+    args = parser.parse_args()
+    flattenTime = checkTime = 0.0
+    nodes = invalid = 0
+    sgPaths = find_scene_graphs(args.datasetDir, args.fileName)
+    for sgPath in sgPaths:
+        start = time.perf_counter()
+        try:
+            arrays = scene_arrays_from_json(sgPath)
+        except Exception as e:
+            print(f"unreadable: {sgPath} ({type(e).__name__}: {e})")
+            invalid += 1
+            continue
+        flattenTime += time.perf_counter() - start
+        start = time.perf_counter()
+        errors = validate_scene_arrays(arrays)
+        scene_statistics(arrays)
+        checkTime += time.perf_counter() - start
+        nodes += len(arrays.ids)
+        invalid += bool(errors)
+    print(f"{len(sgPaths)} scenes, {nodes} nodes, {invalid} invalid")
+    print(f"stream + flatten {flattenTime:8.3f}s")
+    print(f"checks + stats   {checkTime:8.3f}s")
@@ -0,0 +1,90 @@
+"""
+Offline evaluation of the model routing policies: runs every (scene, task) pair of a task file through the full
+pipeline once per policy and reports LLM latency, tokens and plan validity side by side.
+
+The task file is a JSON list of {"sgPath": ..., "task": ...}. A plan counts as valid when it names at least one kept
+instance/part id and no scene id outside the pruned tree.
+
+Usage:
+    python benchmarks/eval_routing.py --tasks tasks.json --policies flash sota adaptive --output routing_eval.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import Pipeline
+from utils.traversal import iter_nodes
+from utils.llm_utils.model_router import ModelRouter, ROUTING_POLICIES
+
+
+def plan_validity(pipeline, plan: str) -> bool:
+    """
+    OUTPUT:
+        True if the plan references at least one kept id and no id of the scene that was pruned away.
+        Purely numeric ids ("2") only count in an explicit id context (id: 2, "2"), so step numbers or angles in the
+        plan are not taken for instance ids
+    """
+    instanceNodes = pipeline.sceneGraphDatabase.instanceNodes
+    keptIDs = {node.nodeID for node, _, _ in iter_nodes([instanceNodes[i] for i in pipeline.keptSG], keptOnly=True)}
+    sceneIDs = {node.nodeID for node, _, _ in iter_nodes(instanceNodes.values())}
+    tokens = {token for token in re.findall(r"[\w./-]+", plan) if not token.isdigit()}
+    tokens.update(re.findall(r"\bid\s*[:#]?\s*[\"'`]?([\w./-]+)", plan, re.IGNORECASE))
+    tokens.update(re.findall(r"[\"'`]([\w./-]+)[\"'`]", plan))
+    mentioned = tokens & sceneIDs
+    return bool(mentioned & keptIDs) and mentioned <= keptIDs
+
+
+def evaluate(tasks, policy: str) -> dict:
+    runs = []
+    for item in tasks:
+        router = ModelRouter(policy)
+        pipeline = Pipeline(item["sgPath"], item["task"], router=router)
+        run = {"sgPath": item["sgPath"], "task": item["task"]}
+        try:
+            pipeline.prune_graph()
+            plan = pipeline.plan()
+            pipeline.AddKinematicRelations(pipeline.sgPath)
+            replan = pipeline.replan(plan)
+            run["valid"] = plan_validity(pipeline, replan)
+        except Exception as e:
+            run["valid"] = False
+            run["error"] = f"{type(e).__name__}: {e}"
+        totals = pipeline.usage.totals()
+        run.update({
+            "latency_s": totals["latency_s"],
+            "total_tokens": totals["total_tokens"],
+            "calls": totals["calls"],
+            "invalid_selections": pipeline.invalidSelections,
+            "routing": router.report(),
+        })
+        runs.append(run)
+    count = len(runs) or 1
+    return {
+        "policy": policy,
+        "runs": runs,
+        "mean_latency_s": sum(run["latency_s"] for run in runs) / count,
+        "mean_tokens": sum(run["total_tokens"] for run in runs) / count,
+        "validity": sum(1 for run in runs if run["valid"]) / count,
+        "invalid_selections_per_run": sum(run["invalid_selections"] for run in runs) / count,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency and plan validity of the model routing policies")
+    parser.add_argument("--tasks", type=str, required=True, help="JSON list of {sgPath, task}")
+    parser.add_argument("--policies", nargs="+", default=list(ROUTING_POLICIES), choices=ROUTING_POLICIES)
+    parser.add_argument("--output", type=str, default=None, help="Where to write the detailed results")
+    args = parser.parse_args()
+    with open(args.tasks, 'r', encoding='utf-8') as f:
+        tasks = json.load(f)
+    results = [evaluate(tasks, policy) for policy in args.policies]
+    print(f"{'policy':<10} {'latency (s)':>12} {'tokens':>10} {'validity':>9} {'invalid sel.':>13}")
+    for result in results:
+        print(f"{result['policy']:<10} {result['mean_latency_s']:>12.2f} {result['mean_tokens']:>10.0f} "
+              f"{result['validity']:>9.0%} {result['invalid_selections_per_run']:>13.2f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
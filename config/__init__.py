@@ -9,5 +9,8 @@ from config.config import (
     SOTA_VLM_SETTINGS,
     VLM_SETTINGS_MIS,
     LLM_SETTINGS_MIS,
+    HTTP_CLIENT_SETTINGS,
+    LOCAL_LLM_SETTINGS,
+    BACKEND_SETTINGS,
 )
 # from config.custom_cfg import IMAGE_PATHS
@@ -21,6 +21,35 @@ LLM_SETTINGS = {
     "temperature": 0.3,
 }
 
+# OpenAI-compatible local model server (llama.cpp server, vLLM, ...), used by LocalVLMClient
+LOCAL_LLM_SETTINGS = {
+    "base_url": "http://127.0.0.1:8080/v1",
+    "model_name": "local-model",
+    "api_key": None,  # sent as a bearer token when set
+    "max_tokens": 1024,
+    "temperature": 0.2,
+    "timeout": 300.0,  # per-request timeout in seconds; batched requests can take long on CPU
+    "batch_size": 16,  # concurrent chat requests of infer_batch
+}
+
+# Backend of each group of stages: "gemini", "local" or "mock" (offline, for profiling)
+# prune: instance_prune, part_prune, task_gate, verify_cache; plan: plan, replan
+BACKEND_SETTINGS = {
+    "prune": "gemini",
+    "plan": "gemini",
+}
+
+# Connection settings of the process-wide pooled Gemini client (utils/llm_utils/client_pool.py)
+HTTP_CLIENT_SETTINGS = {
+    "pool_size": 32,  # maximum open connections shared by every pipeline of the process
+    "max_keepalive": 16,  # idle connections kept open for reuse
+    "keepalive_expiry": 60.0,  # seconds an idle connection stays open
+    "timeout": 120.0,  # per-request timeout in seconds
+    "connect_timeout": 10.0,
+    "http2": True,  # used when the h2 package is installed, HTTP/1.1 keep-alive otherwise
+    "base_url": None,  # override of the API endpoint, e.g. a local stand-in server for benchmarks
+}
+
 # Output settings
 OUTPUT_SETTINGS = {
     "save_processed_images": True,
@@ -67,7 +67,11 @@ def post_processing(jsonStr: str, idPath: str, maskPath: str, outputPath: str):
         jsonStr: JSON string containing the hierarchical structure.
         idPath: Source directory path.
         outputPath: Root output directory path.
+    
+    Returns:
+        dict: Manifest of the export, with the created directories, copied masks and missing masks.
     """
+    manifest = {"outputPath": outputPath, "directories": {}, "copied": [], "missing": [], "status": "ok"}
     # Parse the JSON string
     jsonData = ast.literal_eval(jsonStr)
     
@@ -82,7 +86,8 @@ def post_processing(jsonStr: str, idPath: str, maskPath: str, outputPath: str):
     src_img_path = os.path.join(idPath, "original.jpg")
     if not os.path.exists(src_img_path):
         print(f"Warning: Source image not found at '{src_img_path}'.")
-        return
+        manifest["status"] = "missing source image"
+        return manifest
     
     # Collect directories that should be kept
     directories_to_keep = collect_directories_with_parts(jsonData)
@@ -101,6 +106,7 @@ def post_processing(jsonStr: str, idPath: str, maskPath: str, outputPath: str):
         # Create the output directory
         outputDir = os.path.join(outputPath, dirName)
         os.makedirs(outputDir, exist_ok=True)
+        manifest["directories"][outputDir] = maskFiles
         print(f"Created directory: {outputDir}")
         
         # Copy src_img.png to this directory
@@ -121,11 +127,14 @@ def post_processing(jsonStr: str, idPath: str, maskPath: str, outputPath: str):
             sourceMaskPath = os.path.join(maskPath, maskFile)
             if os.path.exists(sourceMaskPath):
                 shutil.copy(sourceMaskPath, outputDir)
+                manifest["copied"].append(sourceMaskPath)
                 print(f"  - Copied mask: {os.path.basename(maskFile)}")
             else:
+                manifest["missing"].append(sourceMaskPath)
                 print(f"  - Warning: Mask not found: {sourceMaskPath}")
     
     print("Processing completed!")
+    return manifest
 
     
 # Example usage:
@@ -1,9 +1,21 @@
 import networkx as nx
 import json
+import re
 import argparse
+import os
+from contextlib import nullcontext
 from utils import sg_utils
+from utils.prune_memo import PruneMemo, normalize_task, scene_key
+from utils.prune_policy import PrunePolicy, classify_task_granularity
+from utils.sg_query import SceneGraphQuery
+from utils.traversal import walk, iter_nodes, POST_ORDER
+from utils.llm_utils.usage import RunBudget, DEGRADE_NONE, DEGRADE_CHEAP, DEGRADE_STOP
+from utils.llm_utils.model_router import ModelRouter, FLASH_MODEL_INDEX
 from utils.llm_utils.llm_service import *
 from utils.llm_utils.gemini_message import *
+from utils.checkpoint import RunCheckpoint
+from utils.profiling import StageProfiler
+from config import BACKEND_SETTINGS
 from kept_id_process import post_processing
 
 class Pipeline():
@@ -15,31 +27,306 @@ class Pipeline():
         keptSG: list of dict, stores the effective parts of the scene graph
         currentLevel: dict, showing the current focusing id-node pair
         task: str, task command
+        pruneMemo: optional PruneMemo shared across pipelines, reuses pruning results of similar tasks on the same scene
+        sceneKey: str, key of this scene in the prune memo (path, size and modification time of the loaded file)
+        pruneCalls: int, LLM calls spent by the last prune_graph
+        sgPath: str, path of the scene graph JSON file (the source file when a compiled scene is loaded)
+        usage: UsageTracker of the LLM client, per-call and per-stage tokens and latency
+        budget: optional RunBudget. Past its soft fraction the run uses the flash model and compact prompts; once a cap is
+            reached, part-level pruning stops descending
+        modelIndex: int, model index passed to the LLM client while the run is within budget and no router is set
+        router: optional ModelRouter choosing the model index per stage and per call
+        degradeLevel: int, highest degradation level reached in this run
+        invalidSelections: int, pruning answers that named ids which were not offered
+        skippedPruneCalls: int, part-level calls the prune policy avoided in the last prune_graph
+        graphQuery: SceneGraphQuery over the instance level relations of sceneGraphDatabase
+        autoIncludedIDs: list of the instances added by the structure of the scene rather than by the LLM in the last prune_graph
+        llmClient: client of the planning stages, of the "plan" backend of BACKEND_SETTINGS
+        pruneClient: client of the pruning stages, of the "prune" backend; the same object when both backends match.
+            Both record into the same UsageTracker
+        profiler: optional StageProfiler wrapping each stage of run()
     """
-    def __init__(self, sgPath: str, task: str = ""):
-        with open(sgPath, 'r') as f:
-            sceneGraph = json.load(f)   
-        if sceneGraph is None:
-            return 
-        self.sceneGraphDatabase = sg_utils.SceneGraphDatabase(sceneGraph)
+    def __init__(self, sgPath: str, task: str = "", pruneMemo: PruneMemo = None, budget: RunBudget = None, modelIndex: int = 0,
+                 router: ModelRouter = None):
+        loadedPath = sgPath
+        if sgPath.endswith(sg_utils.COMPILED_SUFFIX):
+            # Compiled by preprocess_dataset.py
+            self.sceneGraphDatabase = sg_utils.load_compiled(sgPath)
+            sgPath = self.sceneGraphDatabase.sourcePath or sgPath
+        else:
+            self.sceneGraphDatabase = sg_utils.SceneGraphDatabase()
+            self.sceneGraphDatabase.load_from_stream(sgPath, 1)
+        self.sgPath = sgPath
         self.keptSG = []
         self.task = task
-        self.llmClient = GeminiVLMClient()
+        self.llmClient = create_vlm_client(BACKEND_SETTINGS["plan"])
+        if BACKEND_SETTINGS["prune"] == BACKEND_SETTINGS["plan"]:
+            self.pruneClient = self.llmClient
+        else:
+            self.pruneClient = create_vlm_client(BACKEND_SETTINGS["prune"])
+            self.pruneClient.usage = self.llmClient.usage
+        self.pruneMemo = pruneMemo
+        self.sceneKey = scene_key(loadedPath)
+        self.pruneCalls = 0
+        self.usage = self.llmClient.usage
+        self.budget = budget
+        self.modelIndex = modelIndex
+        self.router = router
+        self.degradeLevel = DEGRADE_NONE
+        self.invalidSelections = 0
+        self.skippedPruneCalls = 0
+        self.graphQuery = SceneGraphQuery(self.sceneGraphDatabase)
+        self.autoIncludedIDs = []
+        self.profiler = None
+        if pruneMemo is not None:
+            self.sceneGraphDatabase.add_change_listener(
+                lambda instanceIDs: self.pruneMemo.invalidate(self.sceneKey, instanceIDs)
+            )
 
-   
-    def prune_graph(self):
+    def check_budget(self) -> int:
+        """
+        OUTPUT:
+            the current degradation level of the run, see RunBudget.level
+        """
+        if self.budget is None:
+            return DEGRADE_NONE
+        level = self.budget.level(self.usage)
+        if level > self.degradeLevel:
+            print(f"Run budget {self.budget.usage_fraction(self.usage):.0%} used, switching to degradation level {level}")
+            self.degradeLevel = level
+        return level
+
+    def compact_prompts(self) -> bool:
+        return self.check_budget() >= DEGRADE_CHEAP
+
+    def choose_model(self, stage: str, msg, depth: int = 0, escalate: bool = False) -> int:
+        """
+        INPUTS:
+            stage: str, pipeline stage of the call
+            msg: the prompt about to be sent
+            depth: int, depth of the node in the part tree for part-level calls
+            escalate: bool, a previous answer to this prompt was invalid
+        OUTPUT:
+            model index of the call: flash when the budget is nearly exhausted, otherwise the router's choice
+        """
+        if self.check_budget() >= DEGRADE_CHEAP:
+            return FLASH_MODEL_INDEX
+        if self.router is None:
+            return self.modelIndex
+        promptChars = sum(len(part.get("text", "")) for content in msg for part in content["parts"])
+        return self.router.choose(stage, promptChars, depth, self.usage, escalate)
+
+    def select_ids(self, stage: str, msg, candidates, depth: int = 0, answer=None) -> list:
+        """
+        INPUTS:
+            stage: str, pipeline stage of the call
+            msg: selection prompt
+            candidates: container of the ids offered in the prompt
+            depth: int, depth of the node in the part tree for part-level calls
+            answer: optional answer already received for msg (an infer_batch result), checked instead of a first call
+        EFFECTS:
+            Ask the LLM for a selection. A selection naming ids that were not offered, or an answer that could not be
+            parsed, is asked again once, on the escalated model with a router. Ids that are still unknown are dropped, and
+            an answer that still cannot be parsed selects nothing
+        OUTPUT:
+            list of selected ids, all in candidates
+        """
+        escalate = False
+        while True:
+            try:
+                if answer is None:
+                    result = self.pruneClient.infer(msg, model_index=self.choose_model(stage, msg, depth, escalate), stage=stage)
+                else:
+                    result, answer = answer, None
+                    if isinstance(result, ValueError):
+                        raise result
+            except ValueError as e:
+                # The client recorded the parse failure, which feeds the router's parse-failure rate of the stage
+                self.pruneCalls += 1
+                if escalate:
+                    print(f"Unparsable answer at {stage} after retrying, selecting nothing: {e}")
+                    return []
+                escalate = True
+                continue
+            self.pruneCalls += 1
+            selectedIDs = result.get("selected_ids", [])
+            invalidIDs = [selectedID for selectedID in selectedIDs if selectedID not in candidates]
+            if not invalidIDs:
+                return selectedIDs
+            self.invalidSelections += 1
+            if self.router is None or escalate:
+                break
+            self.router.record_invalid_selection(stage)
+            escalate = True
+        print(f"Ignoring ids that were not offered at {stage}: {invalidIDs}")
+        return [selectedID for selectedID in selectedIDs if selectedID in candidates]
+
+    def task_needs_parts(self, policy: PrunePolicy) -> bool:
         """
         EFFECTS:
-            Prune the environment graph with LLM recursively
+            Run the task gate of the prune policy; the "llm" gate costs one short call, and an unparsable answer
+            counts as needing parts
+        OUTPUT:
+            whether part-level pruning is needed for the task
+        """
+        if policy is None or policy.gate is None:
+            return True
+        if policy.gate == "keyword":
+            return classify_task_granularity(self.task) == "part"
+        gateMsg = decision_task_granularity(self.task)
+        self.pruneCalls += 1
+        try:
+            gateResult = self.pruneClient.infer(gateMsg, model_index=self.choose_model("task_gate", gateMsg), stage="task_gate")
+        except ValueError as e:
+            # Skipping part-level pruning on a guess could lose the parts the task needs
+            print(f"Unparsable answer at task_gate, descending into parts: {e}")
+            return True
+        return bool(gateResult.get("needs_parts", True))
+
+    def prune_graph(self, policy: PrunePolicy = None):
         """
+        INPUT:
+            policy: optional PrunePolicy limiting the descent into part trees (max depth, kinematic-free subtrees, task gate)
+        EFFECTS:
+            Prune the environment graph with LLM recursively. With a prune memo, an exact task match is reused directly,
+            and a similar task's selection is reused after a single verification call
+        """
+        if self.pruneMemo is not None:
+            cached = self.reuse_cached_selection(policy)
+            if cached is not None:
+                return cached
         self.keptSG = []
-        instanceMsg = decision_prune_graph_instance_level(self.task, self.sceneGraphDatabase, self.sceneGraphDatabase.instanceNodes)
-        instanceResult = self.llmClient.infer(instanceMsg)
-        selectedIDs = instanceResult.get("selected_ids", [])
-        for selectedID in selectedIDs:
-            selectedNode = self.sceneGraphDatabase.instanceNodes[selectedID]
-            self.recursive_prune_node(selectedNode)
-            self.keptSG.append(selectedID)
+        self.pruneCalls = 0
+        self.skippedPruneCalls = 0
+        self.autoIncludedIDs = []
+        needsParts = self.task_needs_parts(policy)
+        candidates = self.instance_candidates(policy)
+        instanceMsg = decision_prune_graph_instance_level(self.task, self.sceneGraphDatabase, candidates, compact=self.compact_prompts())
+        selectedIDs = self.select_ids("instance_prune", instanceMsg, candidates)
+        if policy is not None and policy.includeSupports:
+            instanceNodes = self.sceneGraphDatabase.instanceNodes
+            dependencies = self.graphQuery.structural_dependencies(selectedIDs)
+            self.autoIncludedIDs = [instanceID for instanceID in instanceNodes if instanceID in dependencies]
+        if hasattr(self.pruneClient, "infer_batch"):
+            self.batched_prune_nodes([self.sceneGraphDatabase.instanceNodes[selectedID] for selectedID in selectedIDs], policy, needsParts)
+            self.keptSG.extend(selectedIDs)
+        else:
+            for selectedID in selectedIDs:
+                selectedNode = self.sceneGraphDatabase.instanceNodes[selectedID]
+                self.recursive_prune_node(selectedNode, policy, needsParts)
+                self.keptSG.append(selectedID)
+        # Supports and containers are kept as context for the planner, at instance level and without part calls
+        for instanceID in self.autoIncludedIDs:
+            self.sceneGraphDatabase.instanceNodes[instanceID].keptSG = []
+            self.keptSG.append(instanceID)
+        pruned_json = self.pruned_json()
+        # A selection made on the cheap model or cut short by the budget must not be reused by unconstrained runs
+        if self.pruneMemo is not None and self.degradeLevel == DEGRADE_NONE:
+            self.pruneMemo.store(self.sceneKey, self.task, pruned_json, self.pruneCalls, policy.memo_key() if policy is not None else "")
+        return pruned_json
+
+    def task_anchor_ids(self) -> list:
+        """
+        OUTPUT:
+            ids of the instances the task names, by id or by instance type. Ids match whole tokens only, and purely
+            numeric ids ("2") only in an explicit id context (id: 2, "2"), so counts are not taken for ids;
+            types match with plurals normalized ("cups" names a cup)
+        """
+        taskText = self.task.lower()
+        taskTokens = {token.rstrip(".") for token in re.findall(r"[\w./-]+", taskText)}
+        taskTokens = {token for token in taskTokens if not token.isdigit()}
+        taskTokens.update(re.findall(r"\bid\s*[:#]?\s*[\"'`]?([\w./-]+)", taskText))
+        taskTokens.update(re.findall(r"[\"'`]([\w./-]+)[\"'`]", taskText))
+        taskWords = set(normalize_task(taskText))
+        anchorIDs = []
+        for instanceID, node in self.sceneGraphDatabase.instanceNodes.items():
+            typeWords = set(normalize_task(str(node.nodeType)))
+            if instanceID.lower() in taskTokens or (typeWords and typeWords <= taskWords):
+                anchorIDs.append(instanceID)
+        return anchorIDs
+
+    def instance_candidates(self, policy: PrunePolicy = None) -> dict:
+        """
+        OUTPUT:
+            dict of the instances offered to the LLM at instance-level pruning. With policy.candidateHops set, only the
+            instances within that many relations of the instances named by the task; every instance otherwise, or when
+            the task names none
+        """
+        instanceNodes = self.sceneGraphDatabase.instanceNodes
+        if policy is None or policy.candidateHops is None:
+            return instanceNodes
+        anchorIDs = self.task_anchor_ids()
+        if not anchorIDs:
+            return instanceNodes
+        nearby = self.graphQuery.k_hop(anchorIDs, policy.candidateHops)
+        return {instanceID: node for instanceID, node in instanceNodes.items() if instanceID in nearby}
+
+    def reuse_cached_selection(self, policy: PrunePolicy = None):
+        """
+        EFFECTS:
+            Look the task up in the prune memo, among the trees pruned with the same policy settings, verify a similar hit
+            with one cheap call, and restore the cached keptSG tree
+        OUTPUT:
+            the cached pruned json if it was reused, otherwise None
+        """
+        entry, _ = self.pruneMemo.lookup(self.sceneKey, self.task, policy.memo_key() if policy is not None else "")
+        if entry is None:
+            return None
+        callsSpent = 0
+        if entry["task"] != self.task:
+            verifyMsg = decision_verify_cached_selection(self.task, entry["task"], entry["tree"])
+            callsSpent = 1
+            try:
+                verifyResult = self.pruneClient.infer(verifyMsg, model_index=self.choose_model("verify_cache", verifyMsg), stage="verify_cache")
+            except ValueError as e:
+                # The verification only saves calls; an unparsable answer falls back to full pruning
+                print(f"Unparsable answer at verify_cache, pruning from scratch: {e}")
+                verifyResult = {}
+            if not verifyResult.get("reuse", False):
+                self.pruneMemo.record_reuse(entry, False, callsSpent)
+                return None
+        try:
+            self.apply_pruned_json(entry["tree"])
+        except KeyError:
+            # The cached tree refers to nodes that no longer exist in this scene
+            self.pruneMemo.record_reuse(entry, False, callsSpent)
+            return None
+        self.pruneMemo.record_reuse(entry, True, callsSpent)
+        self.pruneCalls = callsSpent
+        return entry["tree"]
+
+    def apply_pruned_json(self, pruned_json):
+        """
+        INPUT:
+            pruned_json: list of dict, as returned by prune_graph
+        EFFECTS:
+            Restore self.keptSG and the keptSG of every node from a pruned json, as if prune_graph had selected it
+        """
+        roots = [(self.sceneGraphDatabase.instanceNodes[instanceID], item[instanceID]["parts"])
+                 for item in pruned_json for instanceID in item]
+        keptSG = [node.nodeID for node, _ in roots]
+
+        def restore_kept(pair):
+            node, parts = pair
+            node.keptSG = []
+            children = []
+            for item in parts:
+                for partID, partData in item.items():
+                    partNode = node.partNodes[partID]
+                    partNode.partGraph.add_node(partID, node=partNode)
+                    node.keptSG.append(partID)
+                    children.append((partNode, partData["parts"]))
+            return children
+
+        for _ in walk(roots, restore_kept):
+            pass
+        self.keptSG = keptSG
+
+    def pruned_json(self):
+        """
+        OUTPUT:
+            list of dict, the kept instances with their kept part trees
+        """
         pruned_json = []
         for instanceID in self.keptSG:
             instanceNode = self.sceneGraphDatabase.instanceNodes[instanceID]
@@ -55,69 +342,187 @@ class Pipeline():
         INPUT:
             node: The current node to process.
         OUTPUT:
-            A list of dictionaries representing the pruned parts of the node.
-        """
-        part_json = []
-        for partID in node.keptSG:
-            partNode = node.partNodes[partID]
-            part_json.append({
-                partID: {
-                    "parts": self.build_pruned_json(partNode)
-                }
-            })
-        return part_json
+            A list of dictionaries representing the pruned parts of the node, built in one post-order pass over the kept tree.
+        """
+        built = {}
+        for current, _, _ in iter_nodes([node], POST_ORDER, keptOnly=True):
+            built[id(current)] = [
+                {partID: {"parts": built.pop(id(current.partNodes[partID]))}}
+                for partID in current.keptSG
+            ]
+        return built[id(node)]
             
-    def recursive_prune_node(self, instanceNode):
+    def recursive_prune_node(self, instanceNode, policy: PrunePolicy = None, needsParts: bool = True):
+        """
+        INPUTS:
+            instanceNode: Node to prune from
+            policy: optional PrunePolicy; nodes it rejects are kept without descending into their parts
+            needsParts: bool, outcome of the task gate
+        EFFECTS:
+            Helper function to prune the environment graph with LLM, depth first from instanceNode, add nodes to nx.MultiDiGraph.
+            The LLM selection of each node gives the children the traversal engine descends into
+        """
+        depths = {id(instanceNode): 1}
+
+        def select_parts(node):
+            node.keptSG = []
+            compact = self.compact_prompts()
+            if self.degradeLevel >= DEGRADE_STOP:
+                # Out of budget: keep the node but do not descend into its parts
+                return []
+            depth = depths.pop(id(node))
+            if not node.partNodes:
+                return []
+            if policy is not None and not policy.should_descend(node, depth, needsParts):
+                self.skippedPruneCalls += 1
+                return []
+            msg = decision_prune_graph_part_level(self.task, node, compact=compact)
+            selectedIDs = self.select_ids("part_prune", msg, node.partNodes, depth)
+            selectedNodes = []
+            for selectedID in selectedIDs:
+                selectedNode = node.partNodes[selectedID]
+                selectedNode.partGraph.add_node(selectedID, node=selectedNode)
+                node.keptSG.append(selectedID)
+                selectedNodes.append(selectedNode)
+                depths[id(selectedNode)] = depth + 1
+            return selectedNodes
+
+        for _ in walk([instanceNode], select_parts):
+            pass
+
+
+    def batched_prune_nodes(self, instanceNodes, policy: PrunePolicy = None, needsParts: bool = True):
         """
+        INPUTS:
+            instanceNodes: list of Nodes to prune from
+            policy, needsParts: as in recursive_prune_node
         EFFECTS:
-            Helper function to prune the environment graph with LLM recursively, add nodes to nx.MultiDiGraph.
+            Same selection as recursive_prune_node, level by level across all the given instances: the part-level prompts
+            of one depth are sent together through pruneClient.infer_batch, so a local server answers them in one batch.
+            Each answer is checked by select_ids, which asks invalid or unparsable ones again on their own
         """
-        instanceNode.keptSG = []
-        msg = decision_prune_graph_part_level(self.task, instanceNode)
-        result = self.llmClient.infer(msg)
-        selectedIDs = result.get("selected_ids", [])
-        for selectedID in selectedIDs:
-            selectedNode = instanceNode.partNodes[selectedID]
-            selectedNode.partGraph.add_node(selectedID, node=selectedNode)
-            self.recursive_prune_node(selectedNode)
-            instanceNode.keptSG.append(selectedID)
+        level = list(instanceNodes)
+        depth = 1
+        while level:
+            compact = self.compact_prompts()
+            pending = []
+            for node in level:
+                node.keptSG = []
+                if self.degradeLevel >= DEGRADE_STOP or not node.partNodes:
+                    continue
+                if policy is not None and not policy.should_descend(node, depth, needsParts):
+                    self.skippedPruneCalls += 1
+                    continue
+                pending.append(node)
+            if not pending:
+                break
+            msgs = [decision_prune_graph_part_level(self.task, node, compact=compact) for node in pending]
+            modelIndex = self.choose_model("part_prune", msgs[0], depth)
+            results = self.pruneClient.infer_batch(msgs, model_index=modelIndex, stage="part_prune")
+            level = []
+            for node, msg, result in zip(pending, msgs, results):
+                for selectedID in self.select_ids("part_prune", msg, node.partNodes, depth, answer=result):
+                    selectedNode = node.partNodes[selectedID]
+                    selectedNode.partGraph.add_node(selectedID, node=selectedNode)
+                    node.keptSG.append(selectedID)
+                    level.append(selectedNode)
+            depth += 1
 
+    def apply_scene_patch(self, patch):
+        """
+        INPUT:
+            patch: list of patch operations, see SceneGraphDatabase.apply_patch
+        EFFECTS:
+            Update the scene graph in place instead of reloading it. Memoized selections are invalidated only for the
+            affected instances, and removed instances are dropped from keptSG
+        """
+        affected = self.sceneGraphDatabase.apply_patch(patch)
+        self.keptSG = [instanceID for instanceID in self.keptSG if instanceID in self.sceneGraphDatabase.instanceNodes]
+        return affected
 
     def plan(self):
         """
         EFFECTS: 
             task planning
         """
-        planMsg = task_planning(self.keptSG, self.sceneGraphDatabase, self.task)
-        plan = self.llmClient.decide_plan(planMsg)
+        planMsg = task_planning(self.keptSG, self.sceneGraphDatabase, self.task, compact=self.compact_prompts())
+        plan = self.llmClient.decide_plan(planMsg, model_index=self.choose_model("plan", planMsg), stage="plan")
         return plan
     
     def AddKinematicRelations(self, jsonPath):
-        with open(jsonPath, 'r', encoding='utf-8') as f:
-            jsonData = json.load(f)
-        self.sceneGraphDatabase.add_kinematic_relations(jsonData, self.keptSG)
+        self.sceneGraphDatabase.add_kinematic_relations_from_stream(jsonPath, self.keptSG)
     
     def replan(self, plan):
-        replanMsg = task_replanning(self.keptSG, self.sceneGraphDatabase, self.task, plan)
-        replan = self.llmClient.decide_plan(replanMsg)
+        replanMsg = task_replanning(self.keptSG, self.sceneGraphDatabase, self.task, plan, compact=self.compact_prompts())
+        replan = self.llmClient.decide_plan(replanMsg, model_index=self.choose_model("replan", replanMsg), stage="replan")
         return replan
     
-    def run(self, jsonPath):
-        self.prune_graph()
-        plan = self.plan()
+    def profile_stage(self, name: str):
+        return self.profiler.stage(name) if self.profiler is not None else nullcontext()
+
+    def run(self, jsonPath, runDir: str = None, policy: PrunePolicy = None, maskPaths=None):
+        """
+        INPUTS:
+            jsonPath: scene graph JSON file holding the kinematic relations
+            runDir: str, directory where the output of each stage is checkpointed. A rerun with the same directory, scene,
+                task, prune policy and routing resumes after the last completed stage
+            policy: PrunePolicy of the part-level pruning
+            maskPaths: (idPath, maskPath, outputPath) of post_processing; the masks are only exported when given
+        OUTPUT:
+            the plan after replanning
+        """
+        settings = {
+            "prunePolicy": policy.memo_key() if policy is not None else "",
+            "routing": self.router.policy if self.router is not None else None,
+        }
+        checkpoint = RunCheckpoint(runDir, self.sgPath, self.task, settings) if runDir else None
+        if checkpoint is not None and checkpoint.has("prune"):
+            pruned_json = checkpoint.load("prune")
+            self.apply_pruned_json(pruned_json)
+            print("resumed pruned tree from checkpoint")
+        else:
+            with self.profile_stage("prune"):
+                pruned_json = self.prune_graph(policy)
+            if checkpoint is not None:
+                checkpoint.save("prune", pruned_json)
+        print("keptIDs: ")
+        print(pruned_json)
+        if maskPaths is not None and not (checkpoint is not None and checkpoint.has("masks")):
+            with self.profile_stage("masks"):
+                manifest = post_processing(str(pruned_json), *maskPaths)
+            # A failed export is not marked as completed, so the next run retries it
+            if checkpoint is not None and manifest["status"] == "ok":
+                checkpoint.save("masks", manifest)
+        if checkpoint is not None and checkpoint.has("plan"):
+            plan = checkpoint.load("plan")
+        else:
+            with self.profile_stage("plan"):
+                plan = self.plan()
+            if checkpoint is not None:
+                checkpoint.save("plan", plan)
         print("plan: ")
         print(plan)
-        self.AddKinematicRelations(jsonPath)
-        replan = self.replan(plan)
+        if checkpoint is not None and checkpoint.has("replan"):
+            replan = checkpoint.load("replan")
+        else:
+            with self.profile_stage("kinematics"):
+                self.AddKinematicRelations(jsonPath)
+            with self.profile_stage("replan"):
+                replan = self.replan(plan)
+            if checkpoint is not None:
+                checkpoint.save("replan", replan)
         print("plan after replanning: ")
         print(replan)
+        print("LLM usage: ")
+        print(self.usage.report())
+        return replan
         
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Generate plans for tasks and environment scene graphs"
     )
     parser.add_argument(
-        "--sgPath", type=str, required=True, help="Path to the scene graph JSON file"
+        "--sgPath", type=str, required=True, help="Path to the scene graph JSON file, or to a scene compiled by preprocess_dataset.py"
     )
     # parser.add_argument(
     #     "--sgKinematicPath", type=str, required=True, help="Path to the scene graph kinematic relations JSON file"
@@ -128,25 +533,75 @@ if __name__ == "__main__":
         required=True,
         help="Task that the robot is going to complete",
     )
+    parser.add_argument(
+        "--memoPath", type=str, default=None, help="Path to a JSON prune memo shared across runs on similar tasks"
+    )
+    parser.add_argument(
+        "--maxTokens", type=int, default=None, help="Token budget of the run, cheaper modes are used when it runs out"
+    )
+    parser.add_argument(
+        "--maxLatency", type=float, default=None, help="LLM latency budget of the run in seconds"
+    )
+    parser.add_argument(
+        "--maxPartDepth", type=int, default=None, help="Number of part levels below an instance that may be selected"
+    )
+    parser.add_argument(
+        "--skipNonKinematic", action="store_true", help="Do not descend into parts whose subtree has no kinematic relations"
+    )
+    parser.add_argument(
+        "--taskGate", type=str, default=None, choices=["keyword", "llm"],
+        help="Decide per task whether part-level pruning is needed at all"
+    )
+    parser.add_argument(
+        "--routing", type=str, default="adaptive", choices=["flash", "sota", "adaptive"],
+        help="Model routing policy between the flash and sota models"
+    )
+    parser.add_argument(
+        "--candidateHops", type=int, default=None,
+        help="Only offer the instances within this many relations of the instances named by the task"
+    )
+    parser.add_argument(
+        "--includeSupports", action="store_true",
+        help="Keep the instances supporting or containing the selected ones without asking the LLM"
+    )
+    parser.add_argument(
+        "--runDir", type=str, default=None,
+        help="Directory where each stage is checkpointed; rerunning with it resumes after the last completed stage"
+    )
+    parser.add_argument(
+        "--profile", type=str, default=None,
+        help="Directory for per-stage cProfile files, merged folded stacks (flamegraph input) and a summary"
+    )
+    parser.add_argument(
+        "--mockLLM", action="store_true",
+        help="Answer every LLM call with an offline deterministic mock, so profiling only measures the local work"
+    )
 
     args = parser.parse_args()
-    pipeline = Pipeline(args.sgPath, args.task)
-    keptIDs = pipeline.prune_graph()
-    print("keptIDs: ")
-    print(keptIDs)
-    dirPath = os.path.dirname(args.sgPath)
+    pruneMemo = PruneMemo(memoPath=args.memoPath) if args.memoPath else None
+    budget = RunBudget(maxTotalTokens=args.maxTokens, maxLatency=args.maxLatency)
+    if args.mockLLM:
+        BACKEND_SETTINGS.update(prune="mock", plan="mock")
+    profiler = StageProfiler(args.profile) if args.profile else None
+    with profiler.stage("load") if profiler is not None else nullcontext():
+        pipeline = Pipeline(args.sgPath, args.task, pruneMemo=pruneMemo, budget=budget, router=ModelRouter(args.routing))
+    pipeline.profiler = profiler
+    prunePolicy = PrunePolicy(args.maxPartDepth, args.skipNonKinematic, args.taskGate, args.candidateHops, args.includeSupports)
+    dirPath = os.path.dirname(pipeline.sgPath)
     dirName = os.path.basename(dirPath)
-    id = dirName.split(' ')[-1]
-    idPath = f"C:/PartLevelProject/scene_part_seg_dataset/kaf_out/results/vg_minitest/50-id {id}"
-    outputPath = f"C:/PartLevelProject/scene_part_seg_dataset/sample_part_seg_dataset_for_kaf/id {id}"
-    maskPath = f"C:/PartLevelProject/scene_part_seg_dataset/sample_part_seg_dataset/id {id}"
-    post_processing(str(keptIDs), idPath, maskPath, outputPath)
-    plan = pipeline.plan()
-    print(plan)
-    jsonPath = args.sgPath
-    pipeline.AddKinematicRelations(jsonPath)
-    replan = pipeline.replan(plan)
-    outputPlanPath = os.path.join(outputPath, "final_plan.txt")
-    with open(outputPlanPath, 'w') as f:
-        f.write(replan)
-    print(replan)
\ No newline at end of file
+    sceneID = dirName.split(' ')[-1]
+    idPath = f"C:/PartLevelProject/scene_part_seg_dataset/kaf_out/results/vg_minitest/50-id {sceneID}"
+    outputPath = f"C:/PartLevelProject/scene_part_seg_dataset/sample_part_seg_dataset_for_kaf/id {sceneID}"
+    maskPath = f"C:/PartLevelProject/scene_part_seg_dataset/sample_part_seg_dataset/id {sceneID}"
+    replan = pipeline.run(pipeline.sgPath, args.runDir, prunePolicy, (idPath, maskPath, outputPath))
+    if pruneMemo is not None:
+        print("prune memo: ")
+        print(pruneMemo.report())
+    if os.path.isdir(outputPath):
+        outputPlanPath = os.path.join(outputPath, "final_plan.txt")
+        with open(outputPlanPath, 'w') as f:
+            f.write(replan)
+    else:
+        print(f"Output directory {outputPath} does not exist, final plan not written")
+    if profiler is not None:
+        print(f"Profiles written to {args.profile}, summary: {profiler.write()}")
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils import sg_utils
+from utils.sg_stream import iter_scene_items
+from utils.sg_validation import SceneArrays, validate_scene_arrays, scene_statistics
+
+
+def find_scene_graphs(datasetDir: str, fileName: str = "scene_graph.json") -> list:
+    """
+    OUTPUT:
+        sorted list of the scene graph files under datasetDir
+    """
+    sgPaths = []
+    for dirPath, _, fileNames in os.walk(datasetDir):
+        if fileName in fileNames:
+            sgPaths.append(os.path.join(dirPath, fileName))
+    return sorted(sgPaths)
+
+
+def compiled_name(datasetDir: str, sgPath: str) -> str:
+    """
+    OUTPUT:
+        file name of the compiled scene, derived from the scene directory relative to the dataset, e.g. "50-id 6.pkl"
+    """
+    relDir = os.path.relpath(os.path.dirname(sgPath), datasetDir)
+    if relDir == ".":
+        relDir = os.path.basename(os.path.abspath(datasetDir))
+    return relDir.replace(os.sep, "__").replace("/", "__") + sg_utils.COMPILED_SUFFIX
+
+
+def preprocess_scene(sgPath: str, compiledPath: str, rejectInvalid: bool = False) -> dict:
+    """
+    INPUTS:
+        sgPath: path to the scene graph JSON file
+        compiledPath: where the built SceneGraphDatabase is stored
+        rejectInvalid: do not store scenes that fail validation, so they never reach the pipeline
+    EFFECTS:
+        Stream, build and check one scene in a single pass, then store the compiled database.
+        Runs in a worker process, so only the small stats dict travels back to the parent
+    OUTPUT:
+        dict of per-scene stats (see sg_validation.scene_statistics); "errors" lists the problems found,
+        "status" is "ok", "rejected" or "failed"
+    """
+    start = time.perf_counter()
+    stats = {
+        "sgPath": sgPath,
+        "compiledPath": None,
+        "status": "ok",
+        "errors": [],
+        "instances": 0,
+        "parts": 0,
+        "max_depth": 0,
+        "relationships": 0,
+        "kinematic_relations": 0,
+    }
+    try:
+        sceneGraphDatabase = sg_utils.SceneGraphDatabase()
+        sceneGraphDatabase.sourcePath = sgPath
+        arrays = SceneArrays()
+        relationships = []
+        for key, item in iter_scene_items(sgPath, skipUnusedFields=True):
+            if key == "relationships":
+                relationships.append(item)
+                arrays.add_relationship(item)
+                continue
+            arrays.add_object(item)
+            instanceNode = sg_utils.recursive_tree_constructor_without_kinematic(item, "")
+            sceneGraphDatabase.instanceNodes[instanceNode.nodeID] = instanceNode
+            sceneGraphDatabase.instancesGraph.add_node(instanceNode.nodeID, node=instanceNode)
+        for relationship in relationships:
+            subject = relationship.get("subject", "")
+            object = relationship.get("object", "")
+            sceneGraphDatabase.instancesGraph.add_edge(subject, object, predicate=relationship.get("predicate", ""))
+        arrays.finish()
+        stats.update(scene_statistics(arrays))
+        stats["errors"].extend(validate_scene_arrays(arrays))
+        if rejectInvalid and stats["errors"]:
+            stats["status"] = "rejected"
+        else:
+            sg_utils.save_compiled(sceneGraphDatabase, compiledPath)
+            stats["compiledPath"] = compiledPath
+    except Exception as e:
+        stats["status"] = "failed"
+        stats["errors"].append(f"{type(e).__name__}: {e}")
+    stats["build_time_s"] = time.perf_counter() - start
+    return stats
+
+
+def preprocess_dataset(datasetDir: str, outputDir: str, workers: int = None, fileName: str = "scene_graph.json",
+                       rejectInvalid: bool = False) -> dict:
+    """
+    INPUTS:
+        datasetDir: directory searched recursively for scene graph files
+        outputDir: directory receiving the compiled scenes and index.json
+        workers: number of worker processes, defaults to the number of CPUs
+        rejectInvalid: do not compile the scenes that fail validation
+    EFFECTS:
+        Preprocess every scene on a process pool. The largest files are submitted first so the pool stays busy until the end
+    OUTPUT:
+        the index written to outputDir/index.json
+    """
+    os.makedirs(outputDir, exist_ok=True)
+    datasetDir = os.path.abspath(datasetDir)
+    sgPaths = find_scene_graphs(datasetDir, fileName)
+    sgPaths.sort(key=os.path.getsize, reverse=True)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    scenes = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(preprocess_scene, sgPath, os.path.join(os.path.abspath(outputDir), compiled_name(datasetDir, sgPath)),
+                            rejectInvalid)
+            for sgPath in sgPaths
+        ]
+        for future in as_completed(futures):
+            sceneStats = future.result()
+            scenes.append(sceneStats)
+            print(f"[{len(scenes)}/{len(futures)}] {sceneStats['status']}: {sceneStats['sgPath']} ({sceneStats['build_time_s']:.2f}s)")
+    scenes.sort(key=lambda sceneStats: sceneStats["sgPath"])
+    index = {
+        "dataset": datasetDir,
+        "workers": workers,
+        "wall_time_s": time.perf_counter() - start,
+        "scenes": scenes,
+        "summary": {
+            "scenes": len(scenes),
+            "failed": sum(1 for sceneStats in scenes if sceneStats["status"] == "failed"),
+            "rejected": sum(1 for sceneStats in scenes if sceneStats["status"] == "rejected"),
+            "with_errors": sum(1 for sceneStats in scenes if sceneStats["errors"]),
+            "instances": sum(sceneStats["instances"] for sceneStats in scenes),
+            "parts": sum(sceneStats["parts"] for sceneStats in scenes),
+            "cpu_time_s": sum(sceneStats["build_time_s"] for sceneStats in scenes),
+        },
+    }
+    with open(os.path.join(outputDir, "index.json"), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Parse, check and compile every scene graph of a dataset in parallel"
+    )
+    parser.add_argument(
+        "--datasetDir", type=str, required=True, help="Directory searched recursively for scene graph files"
+    )
+    parser.add_argument(
+        "--outputDir", type=str, required=True, help="Directory for the compiled scenes and index.json"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--fileName", type=str, default="scene_graph.json", help="Name of the scene graph files"
+    )
+    parser.add_argument(
+        "--rejectInvalid", action="store_true",
+        help="Do not compile scenes with duplicate ids, dangling relationships or kinematic relations naming missing parts"
+    )
+    args = parser.parse_args()
+    index = preprocess_dataset(args.datasetDir, args.outputDir, args.workers, args.fileName, args.rejectInvalid)
+    summary = index["summary"]
+    print(f"Preprocessed {summary['scenes']} scenes in {index['wall_time_s']:.2f}s with {index['workers']} workers "
+          f"({summary['cpu_time_s']:.2f}s CPU, {summary['failed']} failed, {summary['rejected']} rejected, "
+          f"{summary['with_errors']} with errors)")
@@ -0,0 +1,77 @@
+import json
+import os
+
+# Stage name -> file storing its output inside the run directory
+STAGE_FILES = {
+    "prune": "pruned_tree.json",
+    "masks": "mask_manifest.json",
+    "plan": "plan.txt",
+    "replan": "replan.txt",
+}
+MANIFEST_FILE = "checkpoint.json"
+
+
+class RunCheckpoint:
+    """
+    EFFECTS:
+        Stores the output of each completed pipeline stage in a run directory, so a rerun after a failure resumes from
+        the last completed stage instead of repeating its LLM calls
+    ATTRIBUTES:
+        runDir: str, directory of the run
+        manifest: dict, scene, task and settings of the run plus the list of completed stages
+    """
+    def __init__(self, runDir: str, sgPath: str, task: str, settings: dict = None):
+        """
+        INPUTS:
+            settings: JSON-serializable settings that change the stage outputs (prune policy, routing, ...); a checkpoint
+                is only resumed with the same scene, task and settings
+        """
+        self.runDir = runDir
+        os.makedirs(runDir, exist_ok=True)
+        manifestPath = os.path.join(runDir, MANIFEST_FILE)
+        sgPath = os.path.abspath(sgPath)
+        settings = settings or {}
+        if os.path.exists(manifestPath):
+            with open(manifestPath, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if self.manifest.get("sgPath") != sgPath or self.manifest.get("task") != task:
+                raise ValueError(
+                    f"Run directory {runDir} holds a checkpoint of another run "
+                    f"({self.manifest.get('sgPath')}, {self.manifest.get('task')!r})"
+                )
+            if self.manifest.get("settings", {}) != settings:
+                raise ValueError(
+                    f"Run directory {runDir} holds a checkpoint made with other settings "
+                    f"({self.manifest.get('settings', {})}, now {settings})"
+                )
+        else:
+            self.manifest = {"sgPath": sgPath, "task": task, "settings": settings, "completed": []}
+            self._write(MANIFEST_FILE, json.dumps(self.manifest, indent=2))
+
+    def _write(self, fileName: str, text: str):
+        # Write then rename, so an interrupted run never leaves a truncated checkpoint behind
+        path = os.path.join(self.runDir, fileName)
+        tmpPath = path + ".tmp"
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmpPath, path)
+
+    def has(self, stage: str) -> bool:
+        return stage in self.manifest["completed"]
+
+    def save(self, stage: str, data):
+        """
+        INPUTS:
+            stage: one of STAGE_FILES
+            data: str for text stages (plan, replan), JSON-serializable data otherwise
+        """
+        fileName = STAGE_FILES[stage]
+        self._write(fileName, data if fileName.endswith(".txt") else json.dumps(data, indent=2))
+        if stage not in self.manifest["completed"]:
+            self.manifest["completed"].append(stage)
+        self._write(MANIFEST_FILE, json.dumps(self.manifest, indent=2))
+
+    def load(self, stage: str):
+        fileName = STAGE_FILES[stage]
+        with open(os.path.join(self.runDir, fileName), 'r', encoding='utf-8') as f:
+            return f.read() if fileName.endswith(".txt") else json.load(f)
@@ -0,0 +1,70 @@
+import importlib.util
+import threading
+import httpx
+from google import genai
+from google.genai import types
+from config import HTTP_CLIENT_SETTINGS
+
+# Key: (api key, base url); Value: genai.Client shared by every GeminiVLMClient of the process
+_clients = {}
+_httpClients = []
+_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client(settings: dict = None) -> httpx.Client:
+    """
+    INPUT:
+        settings: dict overriding HTTP_CLIENT_SETTINGS
+    OUTPUT:
+        httpx.Client with a bounded keep-alive connection pool and per-request timeouts
+    """
+    settings = {**HTTP_CLIENT_SETTINGS, **(settings or {})}
+    limits = httpx.Limits(
+        max_connections=settings["pool_size"],
+        max_keepalive_connections=settings["max_keepalive"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"])
+    return httpx.Client(limits=limits, timeout=timeout, http2=bool(settings["http2"]) and http2_available())
+
+
+def get_genai_client(api_key: str, settings: dict = None) -> genai.Client:
+    """
+    EFFECTS:
+        Returns the process-wide genai.Client of this key and endpoint, creating it on first use. Every pipeline of the
+        process then shares one connection pool, so TLS setup is paid once per connection instead of once per client
+    INPUTS:
+        api_key: str, Gemini API key
+        settings: dict overriding HTTP_CLIENT_SETTINGS
+    """
+    settings = {**HTTP_CLIENT_SETTINGS, **(settings or {})}
+    key = (api_key, settings["base_url"])
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            httpClient = build_http_client(settings)
+            httpOptions = types.HttpOptions(
+                httpx_client=httpClient,
+                timeout=int(settings["timeout"] * 1000),  # milliseconds
+                base_url=settings["base_url"],
+            )
+            client = genai.Client(api_key=api_key, http_options=httpOptions)
+            _clients[key] = client
+            _httpClients.append(httpClient)
+        return client
+
+
+def close_genai_clients():
+    """
+    EFFECTS:
+        Closes the pooled connections; the next get_genai_client call opens a new pool
+    """
+    with _lock:
+        for httpClient in _httpClients:
+            httpClient.close()
+        _clients.clear()
+        _httpClients.clear()
@@ -1,23 +1,66 @@
 import json
+from utils.traversal import iter_nodes, POST_ORDER
 
-def decision_prune_graph_instance_level(task, sceneGraphDatabase, currentInstanceDict):
+COMPACT_SELECTION_RULES = """Return STRICTLY valid JSON, nothing else: {"reasoning": "one sentence", "selected_ids": [...]}
+Select the MINIMAL set of ids needed to complete the task, using only the ids listed above."""
+
+
+def compact_prompt(title, task, sections):
+    """
+    INPUTS:
+        title: str, heading of the prompt
+        task: task for planning
+        sections: list of (heading, body) pairs
+    OUTPUT:
+        a short prompt without the long selection criteria, used when the run budget is nearly exhausted
+    """
+    sectionText = "\n".join(f"## {heading}\n{body}" for heading, body in sections)
+    promptText = f"# {title}\n## Task\n{task}\n{sectionText}\n{COMPACT_SELECTION_RULES}"
+    return [
+        {
+            "role": "user",
+            "parts": [{"text": promptText}]
+        }
+    ]
+
+
+def decision_prune_graph_instance_level(task, sceneGraphDatabase, currentInstanceDict, compact=False):
     """
     INPUTS:
         task: task for planning
         sceneGraphDatabase: SceneGraphDatabase type. Storing the scene graph
         currentInstanceDict: a dict. Key: instance id; Value: pointer to its node in scene graph database. Storing the current kept instances
+        compact: bool, use the short prompt
+    EFFECTS:
+        Relations touching an offered instance are listed; their other endpoint is named by type when it is not offered
     """
     instances = []
     instanceLevelRelations = []
     for instID, node in currentInstanceDict.items():
         instanceDescription = f"id: {instID}, instance type: {node.nodeType}"
         instances.append(instanceDescription)
-    for _, _, data in sceneGraphDatabase.instancesGraph.edges(data=True):
-        subject = data.get('subject', 'unknown')
-        object = data.get('object', 'unknown')
+    def endpoint(instID):
+        # Instances that are not offered are named by type only, so the LLM is never shown an id it may not select
+        if instID in currentInstanceDict:
+            return instID
+        if instID in sceneGraphDatabase.instanceNodes:
+            return f"{sceneGraphDatabase.instanceNodes[instID].nodeType} (not offered)"
+        return None
+    for u, v, data in sceneGraphDatabase.instancesGraph.edges(data=True):
+        if u not in currentInstanceDict and v not in currentInstanceDict:
+            continue
+        subject = endpoint(u)
+        object = endpoint(v)
+        if subject is None or object is None:
+            continue
         predicate = data.get('predicate', 'unknown')
         relationDescription = f"subject: {subject}, object: {object}, predicate: {predicate}"
         instanceLevelRelations.append(relationDescription)
+    if compact:
+        return compact_prompt("Instance Selection", task, [
+            ("Instances", ";".join(instances)),
+            ("Relations", ";".join(instanceLevelRelations)),
+        ])
 
     promptText = f"""
 # Robotic Task Planning: Instance Selection
@@ -78,12 +121,13 @@ Return STRICTLY valid JSON with this structure:
         }
     ]
 
-def decision_prune_graph_part_level(task, currentInstance):
+def decision_prune_graph_part_level(task, currentInstance, compact=False):
     """
     INPUTS:
         task: task for planning
         sceneGraphDatabase: SceneGraphDatabase type. Storing the scene graph
         currentInstance: a node in scene graph database. Storing the current kept instances/parts
+        compact: bool, use the short prompt, which names the owner once instead of on every part
     """
     parts = []
     # partLevelRelations = []
@@ -92,10 +136,15 @@ def decision_prune_graph_part_level(task, currentInstance):
     for partID, partNode in partNodes.items():
         partDescription = f"id: {partID}, type: {partNode.nodeType}, from kept object id: {currentInstance.nodeID}, type: {currentInstance.nodeType}"
         parts.append(partDescription)
+    if compact:
+        return compact_prompt("Part Selection", task, [
+            (f"Parts of id: {currentInstance.nodeID}, type: {currentInstance.nodeType}",
+             ";".join(f"id: {partID}, type: {partNode.nodeType}" for partID, partNode in partNodes.items()) or "There is no parts"),
+        ])
     if parts == []:
         partStr = "There is no parts"
     else:
-        partStr = {";".join(parts)}
+        partStr = ";".join(parts)
     # for _, _, data in partGraph.edges(data=True):
     #     subject = data.get("subject", "")
     #     object = data.get("object", "")
@@ -164,36 +213,41 @@ Return STRICTLY valid JSON with this structure:
     ]
     
     
+def item_description(node) -> str:
+    if node.owner == "":
+        return f"id: {node.nodeID}, type: {node.nodeType}, description: {node.description}, level: instance"
+    return f"id: {node.nodeID}, type: {node.nodeType}"
+
+
 def recursive_add_item(node) -> dict:   
     """
     INPUTS: 
         node, node
+    EFFECTS:
+        Describe the kept tree under node in one post-order pass
     """
-    itemDict = {}
-    partList = []
-    for keptnode in node.keptSG:
-        partList.append(recursive_add_item(node.partNodes[keptnode]))
-    if node.owner == "":
-        itemDescription = f"id: {node.nodeID}, type: {node.nodeType}, description: {node.description}, level: instance"
-    else:
-        itemDescription = f"id: {node.nodeID}, type: {node.nodeType}"
-    itemDict["description"] = itemDescription
-    itemDict["parts"] = partList
-    return itemDict
+    built = {}
+    for current, _, _ in iter_nodes([node], POST_ORDER, keptOnly=True):
+        built[id(current)] = {
+            "description": item_description(current),
+            "parts": [built.pop(id(current.partNodes[keptnode])) for keptnode in current.keptSG],
+        }
+    return built[id(node)]
 
-def task_planning(keptSG, sceneGraphDatabase, task: str):
+def task_planning(keptSG, sceneGraphDatabase, task: str, compact=False):
     """
     INPUTS: 
         keptSG, list of dict
         sceneGraphDatabase: SceneGraphDatabase
         task: str, task
+        compact: bool, serialize the scene graph tree without indentation
     """
     itemDict = {}
     instanceList = []
     for keptInstance in keptSG:
         instanceList.append(recursive_add_item(sceneGraphDatabase.instanceNodes[keptInstance]))
     itemDict["instances"] = instanceList
-    scene_graph_json = json.dumps(itemDict, indent=2)
+    scene_graph_json = json.dumps(itemDict, separators=(",", ":")) if compact else json.dumps(itemDict, indent=2)
     promptText = f"""
 # Robotic Task Planning: Task Planning
 
@@ -228,73 +282,152 @@ End with a short confirmation line: “Plan complete.”
     ]
 
 
+def kinematic_relation_description(u, v, data) -> dict:
+    return {
+        'subject_id': u,
+        'object_id': v,
+        'joint_type': data.get('joint_type', 'N/A'),
+        'is_controllable': data.get('controllable', False),
+        'root': data.get('root', ''),
+        'subject_function': data.get('subject_function', []),
+        'object_function': data.get('object_function', []),
+        'subject_desc': data.get('subject_desc', ''),
+        'object_desc': data.get('object_desc', '')
+    }
+
+
 def recursive_add_item_replanning(node) -> dict:   
     """
     INPUTS: 
         node, node
+    EFFECTS:
+        Describe the kept tree under node with the kinematic relations of every kept node, in one post-order pass
     """
-    itemDict = {}
-    partList = []
-    relations = []
-    for keptnode in node.keptSG:
-        partList.append(recursive_add_item(node.partNodes[keptnode]))
-    if node.owner == "":
-        itemDescription = f"id: {node.nodeID}, type: {node.nodeType}, level: instance"
-    else:
-        itemDescription = f"id: {node.nodeID}, type: {node.nodeType}"
-    for u, v, data in node.partGraph.edges(data=True):
-        joint_type = data.get('joint_type', 'N/A')
-        is_controllable = data.get('controllable', False)
-        root = data.get('root', '')
-        subject_function = data.get('subject_function', [])
-        object_function = data.get('object_function', [])
-        subject_desc = data.get('subject_desc', '')
-        object_desc = data.get('object_desc', '')
-        relation = {
-            'subject_id': u,
-            'object_id': v,
-            'joint_type': joint_type,
-            'is_controllable': is_controllable,
-            'root': root,
-            'subject_function': subject_function,
-            'object_function': object_function,
-            'subject_desc': subject_desc,
-            'object_desc': object_desc
+    built = {}
+    for current, _, _ in iter_nodes([node], POST_ORDER, keptOnly=True):
+        if current.owner == "":
+            itemDescription = f"id: {current.nodeID}, type: {current.nodeType}, level: instance"
+        else:
+            itemDescription = f"id: {current.nodeID}, type: {current.nodeType}"
+        built[id(current)] = {
+            "description": itemDescription,
+            "parts": [built.pop(id(current.partNodes[keptnode])) for keptnode in current.keptSG],
+            "kinematic_relations": [kinematic_relation_description(u, v, data) for u, v, data in current.partGraph.edges(data=True)],
         }
-        relations.append(relation)
+    return built[id(node)]
 
-    itemDict["description"] = itemDescription
-    itemDict["parts"] = partList
-    itemDict["kinematic_relations"] = relations
-    return itemDict
 
-
-def task_replanning(keptSG, sceneGraphDatabase, task: str, currentPlan: str):
+def _annotate_part(entry, desc, functions):
+    """
+    EFFECTS:
+        Attach a part description once and merge its functions, instead of repeating them on every joint
+    """
+    if desc and "desc" not in entry:
+        entry["desc"] = desc
+    if isinstance(functions, str):
+        functions = [functions]
+    for function in functions or []:
+        if function and function not in entry.setdefault("fn", []):
+            entry["fn"].append(function)
+    if entry.get("fn") == []:
+        del entry["fn"]
+
+
+def build_replan_context(keptSG, sceneGraphDatabase) -> dict:
+    """
+    INPUTS:
+        keptSG: list of kept instance ids
+        sceneGraphDatabase: SceneGraphDatabase
+    EFFECTS:
+        Build the compact replanning context: the kept tree where every kept node lists the joints among its kept parts,
+        at every depth. Joints are deduplicated [subject, object, joint_type, controllable, root] rows; part descriptions and
+        functions are attached once to the part instead of once per joint. Only instance relations touching a kept
+        instance are kept, as [subject, predicate, object] rows, and "others" gives the type of their non-kept endpoints
+    OUTPUT:
+        dict with "instances", "relations" and "others"
+    """
+    instanceNodes = sceneGraphDatabase.instanceNodes
+    built = {}
+    for current, _, _ in iter_nodes([instanceNodes[instanceID] for instanceID in keptSG], POST_ORDER, keptOnly=True):
+        entry = {"id": current.nodeID, "type": current.nodeType}
+        children = [built.pop(id(current.partNodes[keptnode])) for keptnode in current.keptSG]
+        childByID = {child["id"]: child for child in children}
+        joints = []
+        seenJoints = set()
+        for u, v, data in current.partGraph.edges(data=True):
+            if u not in childByID or v not in childByID:
+                continue
+            joint = [u, v, data.get("joint_type", ""), data.get("controllable", ""), data.get("root", "")]
+            jointKey = tuple(str(field) for field in joint)
+            if jointKey in seenJoints:
+                continue
+            seenJoints.add(jointKey)
+            joints.append(joint)
+            _annotate_part(childByID[u], data.get("subject_desc", ""), data.get("subject_function", []))
+            _annotate_part(childByID[v], data.get("object_desc", ""), data.get("object_function", []))
+        if children:
+            entry["parts"] = children
+        if joints:
+            entry["joints"] = joints
+        built[id(current)] = entry
+    keptInstances = set(keptSG)
+    relations = []
+    seenRelations = set()
+    others = {}
+    for u, v, data in sceneGraphDatabase.instancesGraph.edges(data=True):
+        if u not in keptInstances and v not in keptInstances:
+            continue
+        relation = (u, data.get("predicate", ""), v)
+        if relation in seenRelations:
+            continue
+        seenRelations.add(relation)
+        relations.append(list(relation))
+        for endpoint in (u, v):
+            if endpoint not in keptInstances:
+                others[endpoint] = instanceNodes[endpoint].nodeType if endpoint in instanceNodes else "unknown"
+    context = {"instances": [built[id(instanceNodes[instanceID])] for instanceID in keptSG]}
+    if relations:
+        context["relations"] = relations
+    if others:
+        context["others"] = others
+    return context
+
+
+REPLAN_CONTEXT_LEGEND = """Encoding: each instance/part is {id, type, desc?, fn? (functions), parts? (kept parts), joints?}.
+"joints" of a node are [subject_id, object_id, joint_type, controllable, root] rows among its parts.
+"relations" are [subject_id, predicate, object_id] rows between instances; "others" gives the type of instances that are not kept."""
+
+
+def task_replanning(keptSG, sceneGraphDatabase, task: str, currentPlan: str, compact=False, contextFormat="compact"):
     """
     INPUTS: 
         keptSG, list of dict
         sceneGraphDatabase: SceneGraphDatabase
         task: str, task
-    TODO: add the kinematic relations into consideration. Proposed solution: update the kinematic relations for the previous level in each round
+        compact: bool, serialize the scene graph tree without indentation
+        contextFormat: "compact" for build_replan_context, "tree" for the verbose recursive_add_item_replanning tree
     """
-    itemDict = {}
-    instanceList = []
-    relations = []
-    for keptInstance in keptSG:
-        instanceList.append(recursive_add_item_replanning(sceneGraphDatabase.instanceNodes[keptInstance]))
-    for u, v, data in sceneGraphDatabase.instancesGraph.edges(data=True):
-        subject = data.get("subject", "")
-        object = data.get("object", "")
-        predicate = data.get("predicate", "")
-        relation = {
-            "subject": subject,
-            "object": object,
-            "predicate": predicate
-        }
-        relations.append(relation)
-    itemDict["instances"] = instanceList
-    itemDict["relations"] = relations
-    scene_graph_json = json.dumps(itemDict, indent=2)
+    if contextFormat == "compact":
+        itemDict = build_replan_context(keptSG, sceneGraphDatabase)
+        compact = True
+        legend = REPLAN_CONTEXT_LEGEND + "\n"
+    else:
+        legend = ""
+        itemDict = {}
+        instanceList = []
+        relations = []
+        for keptInstance in keptSG:
+            instanceList.append(recursive_add_item_replanning(sceneGraphDatabase.instanceNodes[keptInstance]))
+        for u, v, data in sceneGraphDatabase.instancesGraph.edges(data=True):
+            relation = {
+                "subject": u,
+                "object": v,
+                "predicate": data.get("predicate", "")
+            }
+            relations.append(relation)
+        itemDict["instances"] = instanceList
+        itemDict["relations"] = relations
+    scene_graph_json = json.dumps(itemDict, separators=(",", ":")) if compact else json.dumps(itemDict, indent=2)
     promptText = f"""
 # Robotic Task Planning: Refine Task Planning
 
@@ -305,7 +438,7 @@ def task_replanning(keptSG, sceneGraphDatabase, task: str, currentPlan: str):
 {currentPlan}
 
 ## Task Related Environment Scene Graph Tree With Kinematic Relations
-```json
+{legend}```json
 {scene_graph_json}
 ```
 ## Your Task
@@ -331,3 +464,80 @@ End with a short confirmation line: “Plan complete.”
             "parts": [{"text": promptText}]
         }
     ]
+
+
+def decision_verify_cached_selection(task, cachedTask, cachedTree):
+    """
+    INPUTS:
+        task: task for planning
+        cachedTask: str, the similar task the cached selection was produced for
+        cachedTree: list of dict, pruned json of the cached selection (as returned by Pipeline.prune_graph)
+    """
+    cached_json = json.dumps(cachedTree)
+    promptText = f"""
+# Robotic Task Planning: Selection Verification
+
+## Task Objective
+{task}
+
+## Cached Selection
+The following instances and parts were selected for the similar task "{cachedTask}" on the same scene:
+```json
+{cached_json}
+```
+
+## Your Task
+Decide whether this selection contains every instance and part needed for the task objective, and nothing that
+the task objective clearly does not need.
+
+## Output Format
+Return STRICTLY valid JSON with this structure:
+{{
+  "reasoning": "Concise analysis (1 sentence)",
+  "reuse": true
+}}
+
+## Critical Rules
+- Set "reuse" to false if any required instance or part is missing
+- DO NOT include any explanatory text outside the JSON
+""".strip()
+
+    return [
+        {
+            "role": "user",
+            "parts": [{"text": promptText}]
+        }
+    ]
+
+
+def decision_task_granularity(task):
+    """
+    INPUTS:
+        task: task for planning
+    EFFECTS:
+        Short prompt asking whether the task needs part-level detail of the instances at all
+    """
+    promptText = f"""
+# Robotic Task Planning: Task Granularity
+
+## Task Objective
+{task}
+
+## Your Task
+Decide whether completing the task requires manipulating specific PARTS of objects (e.g. handles, doors, buttons,
+plugs, lids), or only moving to, picking up or relocating WHOLE objects.
+
+## Output Format
+Return STRICTLY valid JSON with this structure:
+{{
+  "reasoning": "Concise analysis (1 sentence)",
+  "needs_parts": true
+}}
+""".strip()
+
+    return [
+        {
+            "role": "user",
+            "parts": [{"text": promptText}]
+        }
+    ]
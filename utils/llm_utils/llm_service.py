@@ -3,7 +3,8 @@ import time
 import random
 import json
 import re
-from google import genai
+import httpx
+from concurrent.futures import ThreadPoolExecutor
 from mistralai import Mistral
 from config import (
     FLASH_VLM_SETTINGS,
@@ -11,8 +12,11 @@ from config import (
     LLM_SETTINGS,
     VLM_SETTINGS_MIS,
     LLM_SETTINGS_MIS,
+    LOCAL_LLM_SETTINGS,
 )
 import utils.llm_utils.gemini_message as gemini_message
+from utils.llm_utils.usage import UsageTracker, usage_from_response, usage_from_openai
+from utils.llm_utils.client_pool import get_genai_client, build_http_client
 
 
 class BaseVLMClient:
@@ -23,20 +27,39 @@ class BaseVLMClient:
     def __init__(self):
         self.provider = None
         raise NotImplementedError
-    def decide_plan(self, msg, response_format=None, model_index = 0):
+    def decide_plan(self, msg, response_format=None, model_index = 0, stage="plan"):
         raise NotImplementedError
     def infer(
-        self, msg, response_format=None, model_index=0
+        self, msg, response_format=None, model_index=0, stage="infer"
     ):  # model index 0 for llm, 1 for vlm, 2 for sota vlm
         raise NotImplementedError
 
+    def parse_json(self, raw_text, response_format=None, stage="infer") -> dict:
+        """
+        EFFECTS:
+            Decode the JSON object of a response, recording a parse failure under the stage if there is none
+        """
+        if response_format is not None:
+            return json.loads(raw_text)
+        # Clean the string to extract the JSON
+        # This will find the content between the first '{' and the last '}'
+        match = re.search(r"\{.*\}", raw_text, re.DOTALL)
+        if match is None:
+            self.usage.record_parse_failure(stage)
+            raise ValueError(f"No JSON object in the response: {raw_text!r}")
+        try:
+            return json.loads(match.group(0))
+        except json.JSONDecodeError:
+            self.usage.record_parse_failure(stage)
+            raise
+
 
 class GeminiVLMClient(BaseVLMClient):
     def __init__(self):
         api_key = os.environ.get("GENAI_API_KEY")
         if not api_key:
             raise RuntimeError("GENAI_API_KEY environment variable not set")
-        self.client = genai.Client(api_key=api_key)
+        self.client = get_genai_client(api_key)
         self.flash_vlm = FLASH_VLM_SETTINGS["model_name"]
         self.flash_vlm_max_tokens = FLASH_VLM_SETTINGS["max_tokens"]
         self.flash_vlm_temperature = FLASH_VLM_SETTINGS["temperature"]
@@ -47,31 +70,40 @@ class GeminiVLMClient(BaseVLMClient):
         self.llm_max_tokens = LLM_SETTINGS["max_tokens"]
         self.llm_temperature = LLM_SETTINGS["temperature"]
         self.provider = "GEMINI"
+        self.usage = UsageTracker()
 
+    def _generate(self, msg, response_format, model_index, stage):
+        """
+        EFFECTS:
+            Send one generate_content request and record its tokens and latency under the given stage
+        """
+        model = self.flash_vlm if model_index <= 1 else self.sota_vlm
+        start = time.perf_counter()
+        if response_format is None:
+            chat_response = self.client.models.generate_content(
+                model=model,
+                contents=msg,
+            )
+        else:
+            chat_response = self.client.models.generate_content(
+                model=model,
+                contents=msg,
+                generation_config={
+                    "response_mime_type": "application/json",
+                    "response_schema": response_format,
+                },
+            )
+        self.usage.record(stage, model, usage_from_response(chat_response), time.perf_counter() - start)
+        return chat_response
 
-    def decide_plan(self, msg, response_format=None, model_index=0):
+    def decide_plan(self, msg, response_format=None, model_index=0, stage="plan"):
         max_retries = 5
         base_delay = 2  # Base delay in seconds
 
         for attempt in range(max_retries):
             try:
-                if response_format is None:
-                    chat_response = self.client.models.generate_content(
-                        model=self.flash_vlm if model_index <= 1 else self.sota_vlm,
-                        contents=msg,
-                    )
-                    raw_text = chat_response.text
-                    return raw_text
-                else:
-                    chat_response = self.client.models.generate_content(
-                        model=self.flash_vlm if model_index <= 1 else self.sota_vlm,
-                        contents=msg,
-                        generation_config={
-                            "response_mime_type": "application/json",
-                            "response_schema": response_format,
-                        },
-                    )
-                    return chat_response.text
+                chat_response = self._generate(msg, response_format, model_index, stage)
+                return chat_response.text
 
             except Exception as e:
                 # Check if it's a rate limit error or another retryable API error
@@ -99,33 +131,14 @@ class GeminiVLMClient(BaseVLMClient):
         # This line would be reached if the loop completes without returning or raising,
         # which indicates a logic error. We raise an error to handle it.
         raise RuntimeError("Failed to get a response after all retries.")
-    def infer(self, msg, response_format=None, model_index=0) -> dict:
+    def infer(self, msg, response_format=None, model_index=0, stage="infer") -> dict:
         max_retries = 5
         base_delay = 2  # Base delay in seconds
 
         for attempt in range(max_retries):
             try:
-                if response_format is None:
-                    chat_response = self.client.models.generate_content(
-                        model=self.flash_vlm if model_index <= 1 else self.sota_vlm,
-                        contents=msg,
-                    )
-                    raw_text = chat_response.text
-
-                    # Clean the string to extract the JSON
-                    # This will find the content between the first '{' and the last '}'
-                    match = re.search(r"\{.*\}", raw_text, re.DOTALL)
-                    return json.loads(match.group(0))
-                else:
-                    chat_response = self.client.models.generate_content(
-                        model=self.flash_vlm if model_index <= 1 else self.sota_vlm,
-                        contents=msg,
-                        generation_config={
-                            "response_mime_type": "application/json",
-                            "response_schema": response_format,
-                        },
-                    )
-                    return json.loads(chat_response.text)
+                chat_response = self._generate(msg, response_format, model_index, stage)
+                return self.parse_json(chat_response.text, response_format, stage)
 
             except Exception as e:
                 # Check if it's a rate limit error or another retryable API error
@@ -152,4 +165,162 @@ class GeminiVLMClient(BaseVLMClient):
 
         # This line would be reached if the loop completes without returning or raising,
         # which indicates a logic error. We raise an error to handle it.
-        raise RuntimeError("Failed to get a response after all retries.")
\ No newline at end of file
+        raise RuntimeError("Failed to get a response after all retries.")
+
+def message_text(msg) -> str:
+    """
+    OUTPUT:
+        text of a Gemini-style message list (role + parts), as one raw prompt
+    """
+    return "\n\n".join(part["text"] for content in msg for part in content["parts"] if "text" in part)
+
+
+def openai_messages(msg) -> list:
+    """
+    OUTPUT:
+        the Gemini-style message list converted to OpenAI chat messages
+    """
+    messages = []
+    for content in msg:
+        role = "assistant" if content.get("role") == "model" else content.get("role", "user")
+        messages.append({"role": role, "content": "\n\n".join(part["text"] for part in content["parts"] if "text" in part)})
+    return messages
+
+
+class LocalVLMClient(BaseVLMClient):
+    """
+    EFFECTS:
+        Client of a local OpenAI-compatible model server (llama.cpp server, vLLM, ...) configured by LOCAL_LLM_SETTINGS.
+        The server runs a single model, so model_index only labels the usage records.
+        infer_batch sends up to batch_size chat requests concurrently, so a server with parallel slots (llama.cpp
+        --parallel, vLLM continuous batching) runs them in one batched forward pass
+    """
+    def __init__(self, settings: dict = None):
+        settings = {**LOCAL_LLM_SETTINGS, **(settings or {})}
+        self.base_url = settings["base_url"].rstrip("/")
+        self.model = settings["model_name"]
+        self.max_tokens = settings["max_tokens"]
+        self.temperature = settings["temperature"]
+        self.batch_size = settings["batch_size"]
+        self.headers = {"Authorization": f"Bearer {settings['api_key']}"} if settings["api_key"] else {}
+        self.client = build_http_client({"timeout": settings["timeout"], "http2": False})
+        self.provider = "LOCAL"
+        self.usage = UsageTracker()
+
+    def _post(self, route, payload, stage):
+        """
+        EFFECTS:
+            POST to the server, retrying while it is unreachable or still loading the model, and record the usage
+        """
+        max_retries = 5
+        base_delay = 1  # Base delay in seconds
+        for attempt in range(max_retries):
+            start = time.perf_counter()
+            try:
+                response = self.client.post(f"{self.base_url}{route}", json=payload, headers=self.headers)
+                if response.status_code != 503:
+                    response.raise_for_status()
+                    body = response.json()
+                    self.usage.record(stage, self.model, usage_from_openai(body), time.perf_counter() - start)
+                    return body
+                error = RuntimeError(f"Local model server unavailable: {response.text}")
+            except httpx.TransportError as e:
+                error = e
+            if attempt < max_retries - 1:
+                delay = base_delay * (2**attempt)
+                print(f"Local model server not ready ({error}). Retrying in {delay:.2f} seconds... (Attempt {attempt + 1}/{max_retries})")
+                time.sleep(delay)
+        raise error
+
+    def _chat(self, msg, response_format, stage):
+        payload = {
+            "model": self.model,
+            "messages": openai_messages(msg),
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+        }
+        if response_format is not None:
+            payload["response_format"] = {"type": "json_object"}
+        body = self._post("/chat/completions", payload, stage)
+        return body["choices"][0]["message"]["content"]
+
+    def decide_plan(self, msg, response_format=None, model_index=0, stage="plan"):
+        return self._chat(msg, response_format, stage)
+
+    def infer(self, msg, response_format=None, model_index=0, stage="infer") -> dict:
+        return self.parse_json(self._chat(msg, response_format, stage), response_format, stage)
+
+    def infer_batch(self, msgs, response_format=None, model_index=0, stage="infer") -> list:
+        """
+        INPUT:
+            msgs: list of messages, as passed to infer
+        OUTPUT:
+            list of the decoded JSON answers in the order of msgs; the ValueError of an answer that could not be parsed
+            takes its place, so one bad answer does not fail the whole batch and the caller can ask it again
+        """
+        with ThreadPoolExecutor(max_workers=self.batch_size) as executor:
+            texts = list(executor.map(lambda msg: self._chat(msg, response_format, stage), msgs))
+        results = []
+        for text in texts:
+            try:
+                results.append(self.parse_json(text, response_format, stage))
+            except ValueError as e:
+                results.append(e)
+        return results
+
+
+class MockVLMClient(BaseVLMClient):
+    """
+    EFFECTS:
+        Offline stand-in answering instantly and deterministically, so profiling only measures the local side of the
+        pipeline. Selections are the first offered ids of the prompt; plans name the first ids of the prompt
+    """
+    # "id: <id>," of each offered instance/part, but not the owner ids ("object id: ", "Parts of id: ")
+    ID_PATTERN = re.compile(r"(?<!object )(?<!of )id: ([^,;]+),")
+
+    def __init__(self, maxSelected: int = 2):
+        self.maxSelected = maxSelected
+        self.provider = "MOCK"
+        self.usage = UsageTracker()
+
+    def _answer(self, msg, stage, text_fn):
+        start = time.perf_counter()
+        prompt = message_text(msg)
+        ids = [match.strip("{}' ") for match in self.ID_PATTERN.findall(prompt)]
+        text = text_fn(ids)
+        # Rough token counts, about four characters per token
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        self.usage.record(stage, "mock", usage, time.perf_counter() - start)
+        return text
+
+    def decide_plan(self, msg, response_format=None, model_index=0, stage="plan"):
+        return self._answer(msg, stage, lambda ids: "\n".join(
+            [f"{step}. Operate {selectedID}." for step, selectedID in enumerate(ids[:self.maxSelected], 1)] + ["Plan complete."]
+        ))
+
+    def infer(self, msg, response_format=None, model_index=0, stage="infer") -> dict:
+        text = self._answer(msg, stage, lambda ids: json.dumps({
+            "reasoning": "mock",
+            "selected_ids": ids[:self.maxSelected],
+            "needs_parts": True,
+            "reuse": False,
+        }))
+        return self.parse_json(text, response_format, stage)
+
+
+BACKENDS = ("gemini", "local", "mock")
+
+
+def create_vlm_client(backend: str = "gemini"):
+    """
+    OUTPUT:
+        a new client of the given backend, see BACKEND_SETTINGS
+    """
+    if backend == "gemini":
+        return GeminiVLMClient()
+    if backend == "local":
+        return LocalVLMClient()
+    if backend == "mock":
+        return MockVLMClient()
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,76 @@
+FLASH_MODEL_INDEX = 0
+SOTA_MODEL_INDEX = 2
+
+ROUTING_POLICIES = ("flash", "sota", "adaptive")
+
+
+class ModelRouter:
+    """
+    EFFECTS:
+        Picks the model index of each LLM call from the stage and cheap signals of the call, so the sota model
+        (SOTA_VLM_SETTINGS) is only paid for where it is likely to help
+    ATTRIBUTES:
+        policy: "flash" and "sota" always route to one model (baselines for evaluation); "adaptive" uses the signals below
+        sotaStages: stages always routed to the sota model
+        maxFlashPromptChars: prompts longer than this go to the sota model
+        maxFlashDepth: part-level calls deeper than this in the part tree go to the sota model
+        maxParseFailureRate: once this fraction of a stage's responses could not be parsed, the stage goes to the sota model
+        invalidSelections: dict. Key: stage; Value: number of selections that named unknown ids
+        decisions: dict. Key: (stage, model index); Value: number of routed calls
+    """
+    def __init__(self, policy: str = "adaptive", sotaStages=("replan",), maxFlashPromptChars: int = 60000,
+                 maxFlashDepth: int = 4, maxParseFailureRate: float = 0.2):
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy: {policy}")
+        self.policy = policy
+        self.sotaStages = set(sotaStages)
+        self.maxFlashPromptChars = maxFlashPromptChars
+        self.maxFlashDepth = maxFlashDepth
+        self.maxParseFailureRate = maxParseFailureRate
+        self.invalidSelections = {}
+        self.decisions = {}
+
+    def parse_failure_rate(self, stage: str, usage) -> float:
+        if usage is None:
+            return 0.0
+        failures = usage.parseFailures.get(stage, 0)
+        attempts = usage.totals(stage)["calls"]
+        return failures / attempts if attempts else 0.0
+
+    def choose(self, stage: str, promptChars: int = 0, depth: int = 0, usage=None, escalate: bool = False) -> int:
+        """
+        INPUTS:
+            stage: str, pipeline stage of the call
+            promptChars: int, size of the prompt
+            depth: int, depth of the node in the part tree for part-level calls
+            usage: UsageTracker of the run, for the past parse-failure rate of the stage
+            escalate: bool, set when a previous answer to the same prompt was invalid
+        OUTPUT:
+            model index to pass to infer/decide_plan
+        """
+        if self.policy == "flash":
+            modelIndex = FLASH_MODEL_INDEX
+        elif self.policy == "sota":
+            modelIndex = SOTA_MODEL_INDEX
+        elif (
+            escalate
+            or stage in self.sotaStages
+            or promptChars > self.maxFlashPromptChars
+            or depth > self.maxFlashDepth
+            or self.parse_failure_rate(stage, usage) > self.maxParseFailureRate
+        ):
+            modelIndex = SOTA_MODEL_INDEX
+        else:
+            modelIndex = FLASH_MODEL_INDEX
+        self.decisions[(stage, modelIndex)] = self.decisions.get((stage, modelIndex), 0) + 1
+        return modelIndex
+
+    def record_invalid_selection(self, stage: str):
+        self.invalidSelections[stage] = self.invalidSelections.get(stage, 0) + 1
+
+    def report(self) -> dict:
+        return {
+            "policy": self.policy,
+            "decisions": {f"{stage}:{modelIndex}": count for (stage, modelIndex), count in self.decisions.items()},
+            "invalid_selections": dict(self.invalidSelections),
+        }
@@ -0,0 +1,153 @@
+import threading
+
+# Degradation levels of a run, see RunBudget.level
+DEGRADE_NONE = 0
+DEGRADE_CHEAP = 1  # flash model and compact prompts
+DEGRADE_STOP = 2   # additionally stop descending into parts
+
+
+def usage_from_response(response) -> dict:
+    """
+    INPUT:
+        response: a generate_content response of google-genai
+    OUTPUT:
+        dict with input_tokens, output_tokens and total_tokens; zeros when the response carries no usage metadata
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    inputTokens = getattr(metadata, "prompt_token_count", None) or 0
+    outputTokens = getattr(metadata, "candidates_token_count", None) or 0
+    totalTokens = getattr(metadata, "total_token_count", None) or inputTokens + outputTokens
+    return {
+        "input_tokens": inputTokens,
+        "output_tokens": outputTokens,
+        "total_tokens": totalTokens,
+    }
+
+
+def usage_from_openai(payload: dict) -> dict:
+    """
+    INPUT:
+        payload: decoded JSON body of an OpenAI-compatible /chat/completions response
+    OUTPUT:
+        same as usage_from_response, read from the "usage" field
+    """
+    usage = payload.get("usage") or {}
+    inputTokens = usage.get("prompt_tokens") or 0
+    outputTokens = usage.get("completion_tokens") or 0
+    return {
+        "input_tokens": inputTokens,
+        "output_tokens": outputTokens,
+        "total_tokens": usage.get("total_tokens") or inputTokens + outputTokens,
+    }
+
+
+TOTAL_KEYS = ("input_tokens", "output_tokens", "total_tokens", "latency_s")
+
+
+def _empty_totals() -> dict:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "latency_s": 0.0}
+
+
+class UsageTracker:
+    """
+    EFFECTS:
+        Per-call and per-stage accounting of tokens and latency of the LLM calls of a pipeline run
+    ATTRIBUTES:
+        calls: list of dict, one per successful call: stage, model, input_tokens, output_tokens, total_tokens, latency_s
+        parseFailures: dict. Key: stage; Value: number of responses that could not be parsed
+        stageTotals: dict. Key: stage; Value: running totals of the stage, kept by record so budget and routing checks
+            do not re-sum the call log
+    """
+    def __init__(self):
+        self.calls = []
+        self.parseFailures = {}
+        self.stageTotals = {}
+        self.overallTotals = _empty_totals()
+        # infer_batch records the calls of one batch from several threads
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, model: str, usage: dict, latency: float):
+        call = {"stage": stage, "model": model, "latency_s": latency}
+        call.update(usage)
+        with self.lock:
+            self.calls.append(call)
+            for totals in (self.overallTotals, self.stageTotals.setdefault(stage, _empty_totals())):
+                totals["calls"] += 1
+                for key in TOTAL_KEYS:
+                    totals[key] += call[key]
+        return call
+
+    def record_parse_failure(self, stage: str):
+        with self.lock:
+            self.parseFailures[stage] = self.parseFailures.get(stage, 0) + 1
+
+    def totals(self, stage: str = None) -> dict:
+        """
+        OUTPUT:
+            aggregated calls, tokens and latency, over every call or only those of one stage
+        """
+        if stage is None:
+            totals = dict(self.overallTotals)
+        else:
+            totals = dict(self.stageTotals.get(stage) or _empty_totals())
+        if stage is None:
+            totals["parse_failures"] = sum(self.parseFailures.values())
+        else:
+            totals["parse_failures"] = self.parseFailures.get(stage, 0)
+        return totals
+
+    def by_stage(self) -> dict:
+        stages = list(self.stageTotals)
+        stages.extend(stage for stage in self.parseFailures if stage not in stages)
+        return {stage: self.totals(stage) for stage in stages}
+
+    def report(self) -> dict:
+        return {"total": self.totals(), "stages": self.by_stage()}
+
+    def reset(self):
+        self.calls = []
+        self.parseFailures = {}
+        self.stageTotals = {}
+        self.overallTotals = _empty_totals()
+
+
+class RunBudget:
+    """
+    EFFECTS:
+        Caps on the LLM usage of a single pipeline run. Unset caps are not enforced
+    ATTRIBUTES:
+        maxInputTokens, maxOutputTokens, maxTotalTokens, maxCalls: int or None
+        maxLatency: float or None, seconds spent waiting for LLM responses
+        softFraction: fraction of any cap after which the run switches to cheaper modes
+    """
+    def __init__(self, maxInputTokens: int = None, maxOutputTokens: int = None, maxTotalTokens: int = None,
+                 maxCalls: int = None, maxLatency: float = None, softFraction: float = 0.8):
+        self.limits = {
+            "input_tokens": maxInputTokens,
+            "output_tokens": maxOutputTokens,
+            "total_tokens": maxTotalTokens,
+            "calls": maxCalls,
+            "latency_s": maxLatency,
+        }
+        self.softFraction = softFraction
+
+    def usage_fraction(self, usageTracker) -> float:
+        """
+        OUTPUT:
+            the largest used fraction over all set caps
+        """
+        totals = usageTracker.totals()
+        fractions = [totals[key] / limit for key, limit in self.limits.items() if limit]
+        return max(fractions, default=0.0)
+
+    def level(self, usageTracker) -> int:
+        """
+        OUTPUT:
+            DEGRADE_NONE within budget, DEGRADE_CHEAP past the soft fraction of a cap, DEGRADE_STOP once a cap is reached
+        """
+        fraction = self.usage_fraction(usageTracker)
+        if fraction >= 1.0:
+            return DEGRADE_STOP
+        if fraction >= self.softFraction:
+            return DEGRADE_CHEAP
+        return DEGRADE_NONE
@@ -0,0 +1,108 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+FOLDED_FILE = "stacks.folded"
+SUMMARY_FILE = "summary.txt"
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    """
+    EFFECTS:
+        Samples the stack of one thread at a fixed interval and counts the folded stacks, root first
+    """
+    def __init__(self, threadID, interval, counts, prefix):
+        super().__init__(daemon=True)
+        self.threadID = threadID
+        self.interval = interval
+        self.counts = counts
+        self.prefix = prefix
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.threadID)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                stack = ";".join([self.prefix] + labels[::-1])
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+
+
+class StageProfiler:
+    """
+    EFFECTS:
+        Profiles the CPU side of the pipeline stage by stage. Each stage gets a cProfile file <outDir>/<stage>.prof
+        (open with pstats or snakeviz), and a sampling profiler collects the stacks of every stage into one
+        <outDir>/stacks.folded, rooted at the stage name, ready for flamegraph.pl or speedscope
+    ATTRIBUTES:
+        outDir: str, directory receiving the profiles
+        interval: float, seconds between two stack samples; 0 disables the sampling profiler
+        folded: dict. Key: folded stack; Value: number of samples
+        stageTimes: dict. Key: stage; Value: wall time in seconds
+    """
+    def __init__(self, outDir: str, interval: float = 0.005):
+        self.outDir = outDir
+        self.interval = interval
+        self.folded = {}
+        self.stageTimes = {}
+        self.stageRuns = {}
+        self.profiles = {}
+        os.makedirs(outDir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name: str):
+        profile = cProfile.Profile()
+        sampler = None
+        if self.interval > 0:
+            sampler = _StackSampler(threading.get_ident(), self.interval, self.folded, name)
+            sampler.start()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.stageTimes[name] = self.stageTimes.get(name, 0.0) + time.perf_counter() - start
+            if sampler is not None:
+                sampler.stopped.set()
+                sampler.join()
+            # A stage run several times (e.g. pruning of several scenes) gets numbered files
+            self.stageRuns[name] = self.stageRuns.get(name, 0) + 1
+            fileName = name if self.stageRuns[name] == 1 else f"{name}_{self.stageRuns[name]}"
+            profilePath = os.path.join(self.outDir, f"{fileName}.prof")
+            profile.dump_stats(profilePath)
+            self.profiles[fileName] = profilePath
+
+    def write(self, top: int = 25) -> str:
+        """
+        EFFECTS:
+            Write the merged folded stacks and a text summary (wall time and top functions by cumulative time per stage)
+        OUTPUT:
+            path of the summary
+        """
+        with open(os.path.join(self.outDir, FOLDED_FILE), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.folded.items()):
+                f.write(f"{stack} {count}\n")
+        summaryPath = os.path.join(self.outDir, SUMMARY_FILE)
+        with open(summaryPath, 'w', encoding='utf-8') as f:
+            for name, seconds in self.stageTimes.items():
+                f.write(f"{name:<20} {seconds:10.3f}s\n")
+            for fileName, profilePath in self.profiles.items():
+                stream = io.StringIO()
+                pstats.Stats(profilePath, stream=stream).sort_stats("cumulative").print_stats(top)
+                f.write(f"\n===== {fileName} =====\n")
+                f.write(stream.getvalue())
+        return summaryPath
@@ -0,0 +1,219 @@
+import json
+import math
+import os
+import re
+
+STOP_WORDS = {
+    "a", "an", "the", "to", "of", "on", "in", "at", "for", "from", "with", "and",
+    "or", "into", "onto", "by", "it", "its", "this", "that", "these", "those",
+    "please", "then", "up", "is", "are", "be",
+}
+
+# Spatial/verbal paraphrases that should collapse to the same token
+SYNONYMS = {
+    "behind": "back",
+    "rear": "back",
+    "atop": "top",
+    "above": "top",
+    "beneath": "under",
+    "below": "under",
+    "underneath": "under",
+    "put": "place",
+    "set": "place",
+    "relocate": "move",
+    "shift": "move",
+    "grab": "pick",
+    "take": "pick",
+    "fetch": "bring",
+    "carry": "bring",
+}
+
+
+def normalize_task(task: str) -> list:
+    """
+    INPUTS:
+        task: str, raw task command
+    OUTPUT:
+        sorted list of normalized tokens (lowercased, stop words removed, paraphrases collapsed, plural "s" stripped)
+    """
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+", task.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.add(SYNONYMS.get(word, word))
+    return sorted(tokens)
+
+
+def scene_key(sgPath: str) -> str:
+    """
+    OUTPUT:
+        key of a scene graph file in the memo: its absolute path with its size and modification time, so a memo
+        persisted across runs does not replay trees pruned from an older version of the file
+    """
+    stat = os.stat(sgPath)
+    return f"{os.path.abspath(sgPath)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def token_similarity(tokensA, tokensB) -> float:
+    """
+    EFFECTS:
+        Dice coefficient between two normalized token lists
+    """
+    setA, setB = set(tokensA), set(tokensB)
+    if not setA and not setB:
+        return 1.0
+    return 2 * len(setA & setB) / (len(setA) + len(setB))
+
+
+def cosine_similarity(vecA, vecB) -> float:
+    dot = sum(a * b for a, b in zip(vecA, vecB))
+    normA = math.sqrt(sum(a * a for a in vecA))
+    normB = math.sqrt(sum(b * b for b in vecB))
+    if normA == 0 or normB == 0:
+        return 0.0
+    return dot / (normA * normB)
+
+
+class PruneMemo:
+    """
+    EFFECTS:
+        Semantic memo of pruning results. Entries are keyed by scene and by the normalized (or embedded) task,
+        and store the pruned keptSG tree produced by Pipeline.prune_graph, so similar tasks on the same scene can
+        reuse or verify a previous selection instead of walking the whole tree again.
+    ATTRIBUTES:
+        threshold: float, minimum similarity for a lookup to count as a candidate hit
+        embedFn: optional callable str -> list of float. When set, cosine similarity of embeddings is used instead of token overlap
+        memoPath: optional path of a JSON file the memo is persisted to
+        entries: dict. Key: scene key; Value: list of entries {"task", "variant", "tokens", "embedding", "tree", "calls"}.
+            The variant identifies the pruning settings (see PrunePolicy.memo_key); entries are only reused under the same variant
+        stats: dict of counters, see report()
+    """
+    def __init__(self, threshold: float = 0.6, embedFn=None, memoPath: str = None, maxEntriesPerScene: int = 64):
+        self.threshold = threshold
+        self.embedFn = embedFn
+        self.memoPath = memoPath
+        self.maxEntriesPerScene = maxEntriesPerScene
+        self.entries = {}
+        self.stats = {
+            "lookups": 0,
+            "exact_hits": 0,
+            "similar_hits": 0,
+            "reused": 0,
+            "rejected": 0,
+            "misses": 0,
+            "calls_spent": 0,
+            "calls_saved": 0,
+        }
+        if memoPath and os.path.exists(memoPath):
+            self.load(memoPath)
+
+    def _similarity(self, entry, tokens, embedding) -> float:
+        if embedding is not None and entry.get("embedding") is not None:
+            return cosine_similarity(entry["embedding"], embedding)
+        return token_similarity(entry["tokens"], tokens)
+
+    def lookup(self, sceneKey: str, task: str, variant: str = ""):
+        """
+        INPUTS:
+            sceneKey: str, identifies the scene graph
+            task: str, task command
+            variant: str, pruning settings the tree must have been produced with
+        OUTPUT:
+            (entry, similarity) of the most similar cached task above the threshold, or (None, 0.0)
+        """
+        self.stats["lookups"] += 1
+        tokens = normalize_task(task)
+        embedding = self.embedFn(task) if self.embedFn else None
+        bestEntry, bestScore = None, 0.0
+        for entry in self.entries.get(sceneKey, []):
+            if entry.get("variant", "") != variant:
+                continue
+            if entry["task"] == task:
+                self.stats["exact_hits"] += 1
+                return entry, 1.0
+            score = self._similarity(entry, tokens, embedding)
+            if score > bestScore:
+                bestEntry, bestScore = entry, score
+        if bestEntry is not None and bestScore >= self.threshold:
+            self.stats["similar_hits"] += 1
+            return bestEntry, bestScore
+        self.stats["misses"] += 1
+        return None, 0.0
+
+    def store(self, sceneKey: str, task: str, tree: list, calls: int, variant: str = ""):
+        """
+        INPUTS:
+            sceneKey: str, identifies the scene graph
+            task: str, task command
+            tree: list of dict, pruned json as returned by Pipeline.prune_graph
+            calls: int, number of LLM calls spent to produce the tree
+            variant: str, pruning settings the tree was produced with
+        """
+        self.stats["calls_spent"] += calls
+        sceneEntries = self.entries.setdefault(sceneKey, [])
+        sceneEntries[:] = [entry for entry in sceneEntries if (entry["task"], entry.get("variant", "")) != (task, variant)]
+        sceneEntries.append({
+            "task": task,
+            "variant": variant,
+            "tokens": normalize_task(task),
+            "embedding": self.embedFn(task) if self.embedFn else None,
+            "tree": tree,
+            "calls": calls,
+        })
+        if len(sceneEntries) > self.maxEntriesPerScene:
+            del sceneEntries[0]
+        if self.memoPath:
+            self.save(self.memoPath)
+
+    def record_reuse(self, entry, accepted: bool, callsSpent: int):
+        """
+        INPUTS:
+            entry: the entry returned by lookup()
+            accepted: bool, whether the cached tree was reused (exact hit, or similar hit confirmed by verification)
+            callsSpent: int, LLM calls spent on verifying the entry
+        """
+        if accepted:
+            self.stats["reused"] += 1
+            self.stats["calls_saved"] += max(entry["calls"] - callsSpent, 0)
+        else:
+            self.stats["rejected"] += 1
+        self.stats["calls_spent"] += callsSpent
+
+    def invalidate(self, sceneKey: str, instanceIDs=None):
+        """
+        INPUTS:
+            sceneKey: str, identifies the scene graph
+            instanceIDs: iterable of instance ids whose subtrees changed; None drops every entry of the scene
+        """
+        if instanceIDs is None:
+            self.entries.pop(sceneKey, None)
+        else:
+            affected = set(instanceIDs)
+            self.entries[sceneKey] = [
+                entry for entry in self.entries.get(sceneKey, [])
+                if not affected.intersection(instanceID for item in entry["tree"] for instanceID in item)
+            ]
+        if self.memoPath:
+            self.save(self.memoPath)
+
+    def report(self) -> dict:
+        """
+        OUTPUT:
+            dict with the raw counters plus hit rate and the fraction of pruning calls saved
+        """
+        stats = dict(self.stats)
+        lookups = stats["lookups"]
+        stats["hit_rate"] = stats["reused"] / lookups if lookups else 0.0
+        total = stats["calls_spent"] + stats["calls_saved"]
+        stats["savings"] = stats["calls_saved"] / total if total else 0.0
+        return stats
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+
+    def load(self, path: str):
+        with open(path, 'r', encoding='utf-8') as f:
+            self.entries = json.load(f)
@@ -0,0 +1,88 @@
+import re
+
+# Verbs whose tasks manipulate parts (articulations, connectors, fasteners)
+PART_LEVEL_VERBS = {
+    "open", "close", "unplug", "plug", "untie", "tie", "press", "push", "pull", "turn", "rotate", "twist",
+    "unscrew", "screw", "adjust", "switch", "flip", "fold", "unfold", "insert", "unlock", "lock", "slide",
+    "detach", "attach", "disconnect", "connect", "unzip", "zip", "lift", "lower", "tighten", "loosen",
+}
+
+# Verbs whose tasks only move or reach whole instances
+INSTANCE_LEVEL_VERBS = {
+    "move", "bring", "go", "navigate", "place", "put", "carry", "fetch", "take", "pick", "relocate", "find",
+    "locate", "approach", "walk", "deliver", "give", "hand", "set", "drop", "throw", "stack",
+}
+
+GATES = ("keyword", "llm")
+
+
+def classify_task_granularity(task: str) -> str:
+    """
+    INPUT:
+        task: str, task command
+    OUTPUT:
+        "instance" when the task only moves or reaches whole instances, "part" when it manipulates parts or is unclear
+    """
+    words = set(re.findall(r"[a-z]+", task.lower()))
+    if words & PART_LEVEL_VERBS:
+        return "part"
+    if words & INSTANCE_LEVEL_VERBS:
+        return "instance"
+    return "part"
+
+
+class PrunePolicy:
+    """
+    EFFECTS:
+        Limits how far Pipeline.prune_graph descends into the part trees of the selected instances, and how the instance
+        candidates are narrowed with the structure of the instance level relations
+    ATTRIBUTES:
+        maxDepth: int or None, number of part levels below an instance that may be selected; 0 disables part-level pruning
+        skipNonKinematic: bool, do not descend into nodes whose subtree has no kinematic relations
+        gate: None, "keyword" or "llm". Decides once per task whether part-level detail is needed at all; tasks classified
+            as instance-level (navigation, relocation) skip part-level pruning
+        candidateHops: int or None. When set and the task names instances (by id or type), only the instances within this
+            many relations of them are offered to the LLM
+        includeSupports: bool, add the instances supporting or containing the selected ones without asking the LLM
+    """
+    def __init__(self, maxDepth: int = None, skipNonKinematic: bool = False, gate: str = None, candidateHops: int = None,
+                 includeSupports: bool = False):
+        if gate is not None and gate not in GATES:
+            raise ValueError(f"Unknown task gate: {gate}")
+        self.maxDepth = maxDepth
+        self.skipNonKinematic = skipNonKinematic
+        self.gate = gate
+        self.candidateHops = candidateHops
+        self.includeSupports = includeSupports
+
+    def memo_key(self) -> str:
+        """
+        OUTPUT:
+            str identifying the settings that change the pruned tree, used as the PruneMemo variant; "" for the defaults,
+            so a default policy shares entries with runs without a policy
+        """
+        settings = [
+            ("maxDepth", self.maxDepth, None),
+            ("skipNonKinematic", self.skipNonKinematic, False),
+            ("gate", self.gate, None),
+            ("candidateHops", self.candidateHops, None),
+            ("includeSupports", self.includeSupports, False),
+        ]
+        return ";".join(f"{name}={value}" for name, value, default in settings if value != default)
+
+    def should_descend(self, node, depth: int, needsParts: bool = True) -> bool:
+        """
+        INPUTS:
+            node: Node whose parts would be offered to the LLM
+            depth: int, part level the selection would produce (1 for the parts of an instance)
+            needsParts: bool, outcome of the task gate
+        OUTPUT:
+            whether the part-level selection call for this node should be made
+        """
+        if not needsParts:
+            return False
+        if self.maxDepth is not None and depth > self.maxDepth:
+            return False
+        if self.skipNonKinematic and getattr(node, "subtreeKinematicCount", 1) == 0:
+            return False
+        return True
@@ -0,0 +1,129 @@
+from collections import deque
+
+# Predicates meaning the object supports or contains the subject ("cup on table", "fork in drawer")
+SUPPORT_PREDICATES = {
+    "on", "on top of", "in", "inside", "inside of", "within", "supported by", "hanging on", "hung on",
+    "mounted on", "attached to", "placed on", "placed in", "contained in", "stored in", "resting on", "leaning on",
+}
+
+# Predicates meaning the subject supports or contains the object ("table supports cup", "drawer contains fork")
+INVERSE_SUPPORT_PREDICATES = {"supports", "holds", "contains", "has on top", "carries"}
+
+DIRECTIONS = ("out", "in", "both")
+
+
+def normalize_predicate(predicate) -> str:
+    return " ".join(str(predicate).lower().replace("_", " ").split())
+
+
+class SceneGraphQuery:
+    """
+    EFFECTS:
+        Structural queries over the instance level relations of a SceneGraphDatabase (k-hop neighbourhoods,
+        predicate-filtered reachability, supports/containers of instances), answered from adjacency indexes that are
+        built once and rebuilt after the database is patched
+    ATTRIBUTES:
+        sceneGraphDatabase: SceneGraphDatabase queried
+        outEdges: dict. Key: instance id; Value: list of (object id, normalized predicate) of the relations it is the subject of
+        inEdges: dict. Key: instance id; Value: list of (subject id, normalized predicate) of the relations it is the object of
+        predicateIndex: dict. Key: normalized predicate; Value: list of (subject id, object id)
+    """
+    def __init__(self, sceneGraphDatabase):
+        self.sceneGraphDatabase = sceneGraphDatabase
+        self.outEdges = {}
+        self.inEdges = {}
+        self.predicateIndex = {}
+        self._indexKey = None
+
+    def _index_key(self):
+        # Patches bump the revision; the edge count also catches relations added outside apply_patch
+        graph = self.sceneGraphDatabase.instancesGraph
+        return (self.sceneGraphDatabase.revision, graph.number_of_nodes(), graph.number_of_edges())
+
+    def refresh(self):
+        """
+        EFFECTS:
+            Rebuild the adjacency indexes if the database changed since they were built
+        """
+        indexKey = self._index_key()
+        if indexKey == self._indexKey:
+            return
+        self.outEdges = {}
+        self.inEdges = {}
+        self.predicateIndex = {}
+        for u, v, data in self.sceneGraphDatabase.instancesGraph.edges(data=True):
+            predicate = normalize_predicate(data.get("predicate", ""))
+            self.outEdges.setdefault(u, []).append((v, predicate))
+            self.inEdges.setdefault(v, []).append((u, predicate))
+            self.predicateIndex.setdefault(predicate, []).append((u, v))
+        self._indexKey = indexKey
+
+    def neighbours(self, instanceID, direction: str = "both", predicates=None) -> set:
+        """
+        INPUTS:
+            instanceID: str, instance id
+            direction: "out" (instanceID is the subject), "in" (instanceID is the object) or "both"
+            predicates: optional container of normalized predicates the relations must have
+        OUTPUT:
+            set of the instance ids related to instanceID
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown relation direction: {direction}")
+        self.refresh()
+        return self._neighbours(instanceID, direction, predicates)
+
+    def _neighbours(self, instanceID, direction, predicates) -> set:
+        # Reads the indexes as they are; public queries refresh them once before traversing
+        result = set()
+        if direction in ("out", "both"):
+            result.update(v for v, predicate in self.outEdges.get(instanceID, ()) if predicates is None or predicate in predicates)
+        if direction in ("in", "both"):
+            result.update(u for u, predicate in self.inEdges.get(instanceID, ()) if predicates is None or predicate in predicates)
+        result.discard(instanceID)
+        return result
+
+    def k_hop(self, anchorIDs, k: int, direction: str = "both", predicates=None) -> dict:
+        """
+        OUTPUT:
+            dict. Key: instance id within k relations of an anchor; Value: number of hops (0 for the anchors)
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown relation direction: {direction}")
+        self.refresh()
+        hops = {anchorID: 0 for anchorID in anchorIDs}
+        queue = deque(hops)
+        while queue:
+            current = queue.popleft()
+            if hops[current] >= k:
+                continue
+            for neighbour in self._neighbours(current, direction, predicates):
+                if neighbour not in hops:
+                    hops[neighbour] = hops[current] + 1
+                    queue.append(neighbour)
+        return hops
+
+    def reachable(self, sourceIDs, predicates=None, direction: str = "out") -> set:
+        """
+        OUTPUT:
+            set of the instance ids reachable from the sources through relations with the given predicates,
+            sources excluded
+        """
+        hops = self.k_hop(sourceIDs, float("inf"), direction, predicates)
+        return set(hops) - set(sourceIDs)
+
+    def structural_dependencies(self, instanceIDs) -> set:
+        """
+        OUTPUT:
+            set of the instances that support or contain the given instances, transitively
+            (cup on tray on table -> tray, table), given instances excluded
+        """
+        self.refresh()
+        found = set(instanceIDs)
+        stack = list(instanceIDs)
+        while stack:
+            current = stack.pop()
+            supports = self._neighbours(current, "out", SUPPORT_PREDICATES) | self._neighbours(current, "in", INVERSE_SUPPORT_PREDICATES)
+            for support in supports - found:
+                found.add(support)
+                stack.append(support)
+        return found - set(instanceIDs)
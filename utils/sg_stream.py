@@ -0,0 +1,154 @@
+import json
+
+try:
+    import ijson
+except ImportError:  # optional, the incremental parser below is used instead
+    ijson = None
+
+# Fields of an "objects" entry (and of its "children", recursively) that the pipeline reads
+USED_FIELDS = {"id", "instance description", "kaf_name", "children", "kinematic_relations"}
+
+
+def strip_unused_fields(part):
+    """
+    INPUT:
+        part: JSON format description of an instance/part
+    EFFECTS:
+        Drop, in place and recursively, every field the pipeline never reads (masks, bboxes, ...)
+    """
+    stack = [part]
+    while stack:
+        current = stack.pop()
+        for key in [key for key in current if key not in USED_FIELDS]:
+            del current[key]
+        stack.extend(current.get("children", []))
+    return part
+
+
+class _IncrementalReader:
+    """
+    EFFECTS:
+        Minimal incremental JSON reader. Only the current chunk and the value being decoded are held in memory.
+    """
+    def __init__(self, f, chunkSize):
+        self.f = f
+        self.chunkSize = chunkSize
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None) -> bool:
+        data = self.f.read(size or self.chunkSize)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        OUTPUT:
+            the next non-whitespace character without consuming it, "" at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed scene graph JSON: expected '{char}', found '{found}'")
+        self.pos += 1
+
+    def value(self):
+        """
+        OUTPUT:
+            the next complete JSON value, reading more until it can be decoded. Each retry reads as much as is already
+            buffered, so the buffer doubles and a large value is decoded O(log(size / chunkSize)) times, not once per chunk
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number or literal ending exactly at the buffer end may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    if self.pos > self.chunkSize:
+                        self.buf = self.buf[self.pos:]
+                        self.pos = 0
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(max(self.chunkSize, len(self.buf) - self.pos))
+
+
+def _iter_items_incremental(f, keys, chunkSize):
+    with f:
+        yield from _iter_items_reader(_IncrementalReader(f, chunkSize), keys)
+
+
+def _iter_items_reader(reader, keys):
+    reader.expect("{")
+    while reader.peek() != "}":
+        key = reader.value()
+        reader.expect(":")
+        if key in keys and reader.peek() == "[":
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield key, reader.value()
+                if reader.peek() == ",":
+                    reader.expect(",")
+            reader.expect("]")
+        else:
+            reader.value()
+        if reader.peek() == ",":
+            reader.expect(",")
+
+
+def _iter_items_ijson(sgPath, keys):
+    # One pass per key: ijson.items builds each entry in the C backend, which is faster than
+    # assembling entries from the event stream in Python
+    for key in keys:
+        with open(sgPath, 'rb') as f:
+            for item in ijson.items(f, f"{key}.item", use_float=True):
+                yield key, item
+
+
+def iter_scene_items(sgPath: str, keys=("objects", "relationships"), skipUnusedFields: bool = False, chunkSize: int = 1 << 20):
+    """
+    INPUTS:
+        sgPath: path to the scene graph JSON file
+        keys: top-level array keys whose entries are yielded
+        skipUnusedFields: drop the fields of "objects" entries the pipeline never reads
+        chunkSize: characters read per chunk by the fallback parser
+    EFFECTS:
+        Stream the entries of the top-level arrays one at a time, so the whole scene is never held as a dict.
+        ijson is used when installed, otherwise a built-in incremental parser
+    OUTPUT:
+        generator of (key, entry). With ijson the entries are grouped by key in the order of keys
+    """
+    if ijson is not None:
+        items = _iter_items_ijson(sgPath, keys)
+    else:
+        f = open(sgPath, 'r', encoding='utf-8')
+        items = _iter_items_incremental(f, set(keys), chunkSize)
+    for key, item in items:
+        if skipUnusedFields and key == "objects":
+            strip_unused_fields(item)
+        yield key, item
+
+
+def iter_scene_objects(sgPath: str, skipUnusedFields: bool = False):
+    """
+    OUTPUT:
+        generator over the "objects" entries of the scene graph
+    """
+    for _, instance in iter_scene_items(sgPath, keys=("objects",), skipUnusedFields=skipUnusedFields):
+        yield instance
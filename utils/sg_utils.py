@@ -1,4 +1,7 @@
+import pickle
 import networkx as nx
+from utils.sg_stream import iter_scene_items, iter_scene_objects
+from utils.traversal import walk, iter_nodes, json_children, POST_ORDER
 
 class Node():
     """
@@ -11,8 +14,11 @@ class Node():
         partNodes: a dict that stores all the parts of this node
         keptSG: a list storing the effective parts for a certain task, need to be refreshed for each pruning
         owner: id of the father node; "" for instances
+        version: int, bumped whenever this node or any node of its subtree is patched. Derived caches can key on (nodeID, version)
+        kinematicCount: int, number of kinematic relations among the parts of this node in the scene graph JSON, known even before they are added to partGraph
+        subtreeKinematicCount: int, kinematicCount summed over this node and all its descendants
     """
-    def __init__(self, nodeID: str = "-1", nodeType: str = "null", description: str = "nil", partGraph: nx.MultiDiGraph = nx.MultiDiGraph(), partNodes = {}, owner: str = ""):
+    def __init__(self, nodeID: str = "-1", nodeType: str = "null", description: str = "nil", partGraph: nx.MultiDiGraph = nx.MultiDiGraph(), partNodes = {}, owner: str = "", kinematicCount: int = 0):
         self.nodeID = nodeID
         self.nodeType = nodeType
         self.description = description
@@ -20,77 +26,119 @@ class Node():
         self.partNodes = partNodes
         self.keptSG = []
         self.owner = owner
-    
+        self.version = 0
+        self.kinematicCount = kinematicCount
+        self.subtreeKinematicCount = kinematicCount + sum(partNode.subtreeKinematicCount for partNode in partNodes.values())
+
+def add_kinematic_edge(partGraph, kinematicRelation):
+    """
+    INPUTS:
+        partGraph: nx.MultiDiGraph of the owner node
+        kinematicRelation: JSON format description of a kinematic relation
+    EFFECTS:
+        Add the kinematic relation as an edge of partGraph
+    """
+    partGraph.add_edge(
+        kinematicRelation.get("subject"),
+        kinematicRelation.get("object"),
+        subject=kinematicRelation.get("subject", ""),
+        object=kinematicRelation.get("object", ""),
+        joint_type=kinematicRelation.get("joint_type", ""),
+        controllable=kinematicRelation.get("controllable", ""),
+        root=kinematicRelation.get("root", ""),
+        subject_function=kinematicRelation.get("subject_function", []),
+        object_function=kinematicRelation.get("object_function", []),
+        subject_desc=kinematicRelation.get("subject_desc", ""),
+        object_desc=kinematicRelation.get("object_desc", "")
+    )
+
 def recursive_tree_constructor_without_kinematic(part, ownerID) -> Node:
     """
     INPUTS: 
         part: JSON format description of the part; NOTE: without kinematic relationships!!!
         ownerID: str, father node; "" if adding nodes for instances
     EFFECTS:
-        Recursively parse through the input json to construct the node
+        Parse through the input json in one post-order pass of the traversal engine to construct the node
     OUTPUT: 
         output: a Node storing all information about a part and its parts
     """
-    instanceID = part.get("id", "")
-    instanceDes = part.get("instance description", {})
-    if instanceDes == "":
-        instanceDes = {}
-    instanceType = instanceDes.get("name", part.get("kaf_name", ""))
-    if ownerID == "":
-        instanceDescription = part.get("instance description", "")
-    else:
-        instanceDescription = "nil"
-    partGraph = nx.MultiDiGraph()
-    partList = part.get("children", [])
-    partNodes = {}
-    for subpart in partList:
-        partNode = recursive_tree_constructor_without_kinematic(subpart, instanceID)
-        partID = partNode.nodeID
-        partNodes[partID] = partNode
-    instanceNode = Node(
-        nodeID=str(instanceID),
-        nodeType=instanceType,
-        description=instanceDescription,
-        partGraph=partGraph,
-        partNodes=partNodes,
-        owner=ownerID
-    )
-    return instanceNode
+    built = {}
+    for current, parent, _ in walk([part], json_children, POST_ORDER):
+        currentOwnerID = ownerID if parent is None else parent.get("id", "")
+        instanceID = current.get("id", "")
+        instanceDes = current.get("instance description", {})
+        if instanceDes == "":
+            instanceDes = {}
+        instanceType = instanceDes.get("name", current.get("kaf_name", ""))
+        if currentOwnerID == "":
+            instanceDescription = current.get("instance description", "")
+        else:
+            instanceDescription = "nil"
+        partNodes = {}
+        for subpart in current.get("children", []):
+            partNode = built.pop(id(subpart))
+            partNodes[partNode.nodeID] = partNode
+        built[id(current)] = Node(
+            nodeID=str(instanceID),
+            nodeType=instanceType,
+            description=instanceDescription,
+            partGraph=nx.MultiDiGraph(),
+            partNodes=partNodes,
+            owner=currentOwnerID,
+            kinematicCount=len(current.get("kinematic_relations", []))
+        )
+    return built[id(part)]
 
-def recursive_tree_constructor_add_kinematic(parts, node):
+def recursive_tree_constructor_add_kinematic(parts, node, overlay=None):
     """
     INPUTS: 
         part: JSON format description of the part; NOTE: with kinematic relationships!!!
         node: node to be added kinematic relationships 
+        overlay: optional dict of patched kinematic relations, see SceneGraphDatabase.kinematicOverlay
     EFFECTS:
-        Recursively parse through the input json to construct the kinematic relations under this node
-    """
-    partList = parts.get("children", [])
-    kinematicRelations = parts.get("kinematic_relations", [])
-    partGraph = node.partGraph
-    for part in node.keptSG:
-        for subpart in partList:
-            if part == subpart.get("id", ""):
-                recursive_tree_constructor_add_kinematic(subpart, node.partNodes[part])
-    for kinematicRelation in kinematicRelations:
-        subject_id = kinematicRelation.get("subject")
-        object_id = kinematicRelation.get("object")
-        if subject_id in node.keptSG and object_id in node.keptSG:
-            partGraph.add_edge(
-                subject_id,
-                object_id,
-                subject=kinematicRelation.get("subject", ""),
-                object=kinematicRelation.get("object", ""),
-                joint_type=kinematicRelation.get("joint_type", ""),
-                controllable=kinematicRelation.get("controllable", ""),
-                root=kinematicRelation.get("root", ""),
-                subject_function=kinematicRelation.get("subject_function", []),
-                object_function=kinematicRelation.get("object_function", []),
-                subject_desc=kinematicRelation.get("subject_desc", ""),
-                object_desc=kinematicRelation.get("object_desc", "")
-            )
-    
-    return
+        Walk the kept parts of the node together with the input json to construct the kinematic relations under this node.
+        Relations removed by a patch are skipped, relations added by a patch are added, and relations already in
+        partGraph (added by a patch after an earlier pass) are not added twice
+    """
+    overlay = overlay or {}
+    # Overlay paths still matching the ids walked so far, tracked only down the branches leading to a patched owner,
+    # so an empty overlay costs nothing and no id path is ever rebuilt
+    matchingPaths = {}
+    def kept_json_children(pair):
+        current, currentNode = pair
+        subpartsByID = {}
+        for subpart in current.get("children", []):
+            subpartsByID.setdefault(subpart.get("id", ""), []).append(subpart)
+        return [
+            (subpart, currentNode.partNodes[part])
+            for part in currentNode.keptSG
+            for subpart in subpartsByID.get(part, [])
+        ]
+
+    for (current, currentNode), parent, depth in walk([(parts, node)], kept_json_children):
+        patched = {"added": [], "removed": set()}
+        if overlay:
+            ownerPaths = overlay if parent is None else matchingPaths.get(id(parent[1]), ())
+            ownerPaths = [ownerPath for ownerPath in ownerPaths if len(ownerPath) > depth and ownerPath[depth] == currentNode.nodeID]
+            for ownerPath in ownerPaths:
+                if len(ownerPath) == depth + 1:
+                    patched = overlay[ownerPath]
+            if ownerPaths:
+                matchingPaths[id(currentNode)] = ownerPaths
+        keptIDs = set(currentNode.keptSG)
+        existingEdges = set(currentNode.partGraph.edges())
+        for kinematicRelation in current.get("kinematic_relations", []):
+            subject_id = kinematicRelation.get("subject")
+            object_id = kinematicRelation.get("object")
+            if (subject_id, object_id) in patched["removed"] or (subject_id, object_id) in existingEdges:
+                continue
+            if subject_id in keptIDs and object_id in keptIDs:
+                add_kinematic_edge(currentNode.partGraph, kinematicRelation)
+        for kinematicRelation in patched["added"]:
+            subject_id = kinematicRelation.get("subject")
+            object_id = kinematicRelation.get("object")
+            if subject_id in keptIDs and object_id in keptIDs and not currentNode.partGraph.has_edge(subject_id, object_id):
+                add_kinematic_edge(currentNode.partGraph, kinematicRelation)
         
 def recursive_tree_constructor_with_kinematic(part, ownerID) -> Node:
     """
@@ -98,46 +146,117 @@ def recursive_tree_constructor_with_kinematic(part, ownerID) -> Node:
         part: JSON format description of the part; NOTE: with kinematic relationships!!!
         ownerID: str, father node; "" if adding nodes for instances
     EFFECTS:
-        Recursively parse through the input json to construct the node
+        Parse through the input json in one post-order pass of the traversal engine to construct the node
     OUTPUT: 
         output: a Node storing all information about a part and its parts
     """
-    instanceID = part.get("id", "")
-    instanceType = part.get("instance description", {}).get("name", part.get("kaf_name", ""))
-    kinematicRelations = part.get("kinematic_relations", [])
-    partGraph = nx.MultiDiGraph()
-    partList = part.get("children", [])
-    partNodes = {}
-    for subpart in partList:
-        partNode = recursive_tree_constructor_with_kinematic(subpart, instanceID)
-        partID = partNode.nodeID
-        partNodes[partID] = partNode
-        partGraph.add_node(partID, node=partNode)
-    for kinematicRelation in kinematicRelations:
-        subject_id = kinematicRelation.get("subject")
-        object_id = kinematicRelation.get("object")
-        if subject_id in partNodes and object_id in partNodes:
-            partGraph.add_edge(
-                subject_id,
-                object_id,
-                subject=kinematicRelation.get("subject", ""),
-                object=kinematicRelation.get("object", ""),
-                joint_type=kinematicRelation.get("joint_type", ""),
-                controllable=kinematicRelation.get("controllable", ""),
-                root=kinematicRelation.get("root", ""),
-                subject_function=kinematicRelation.get("subject_function", []),
-                object_function=kinematicRelation.get("object_function", []),
-                subject_desc=kinematicRelation.get("subject_desc", ""),
-                object_desc=kinematicRelation.get("object_desc", "")
-            )
-    instanceNode = Node(
-        nodeID=str(instanceID),
-        nodeType=instanceType,
-        partGraph=partGraph,
-        partNodes=partNodes,
-        owner=ownerID
-    )
-    return instanceNode
+    built = {}
+    for current, parent, _ in walk([part], json_children, POST_ORDER):
+        currentOwnerID = ownerID if parent is None else parent.get("id", "")
+        instanceID = current.get("id", "")
+        instanceType = current.get("instance description", {}).get("name", current.get("kaf_name", ""))
+        partGraph = nx.MultiDiGraph()
+        partNodes = {}
+        for subpart in current.get("children", []):
+            partNode = built.pop(id(subpart))
+            partID = partNode.nodeID
+            partNodes[partID] = partNode
+            partGraph.add_node(partID, node=partNode)
+        for kinematicRelation in current.get("kinematic_relations", []):
+            subject_id = kinematicRelation.get("subject")
+            object_id = kinematicRelation.get("object")
+            if subject_id in partNodes and object_id in partNodes:
+                add_kinematic_edge(partGraph, kinematicRelation)
+        built[id(current)] = Node(
+            nodeID=str(instanceID),
+            nodeType=instanceType,
+            partGraph=partGraph,
+            partNodes=partNodes,
+            owner=currentOwnerID,
+            kinematicCount=len(current.get("kinematic_relations", []))
+        )
+    return built[id(part)]
+
+COMPILED_SUFFIX = ".pkl"
+
+COMPILED_FORMAT = "flat-v1"
+
+def _graph_rows(graph, nodes):
+    """
+    OUTPUT:
+        (node rows, edge rows) of a graph whose "node" attributes point into nodes (a dict id -> Node);
+        the attribute is stored as a flag and resolved again on load
+    """
+    nodeRows = [(nodeID, "node" in data) for nodeID, data in graph.nodes(data=True)]
+    edgeRows = list(graph.edges(keys=True, data=True))
+    return nodeRows, edgeRows
+
+def _restore_graph(rows, nodes) -> nx.MultiDiGraph:
+    nodeRows, edgeRows = rows
+    graph = nx.MultiDiGraph()
+    for nodeID, hasNode in nodeRows:
+        if hasNode and nodeID in nodes:
+            graph.add_node(nodeID, node=nodes[nodeID])
+        else:
+            graph.add_node(nodeID)
+    for u, v, key, data in edgeRows:
+        graph.add_edge(u, v, key=key, **data)
+    return graph
+
+def save_compiled(sceneGraphDatabase, path):
+    """
+    EFFECTS:
+        Store a built SceneGraphDatabase, so later runs skip parsing and tree construction.
+        The node trees are stored flat, one row per node with the row of its parent, so pickling never recurses
+        through deep part hierarchies
+    """
+    rows = []
+    rowOf = {}
+    for node, parent, _ in iter_nodes(sceneGraphDatabase.instanceNodes.values()):
+        rowOf[id(node)] = len(rows)
+        fields = {key: value for key, value in node.__dict__.items() if key not in ("partGraph", "partNodes")}
+        selfNodes = dict(node.partNodes)
+        selfNodes.setdefault(node.nodeID, node)
+        rows.append((-1 if parent is None else rowOf[id(parent)], fields, _graph_rows(node.partGraph, selfNodes)))
+    state = {key: value for key, value in sceneGraphDatabase.__dict__.items() if key not in ("instanceNodes", "instancesGraph", "changeListeners")}
+    compiled = {
+        "format": COMPILED_FORMAT,
+        "state": state,
+        "nodes": rows,
+        "instancesGraph": _graph_rows(sceneGraphDatabase.instancesGraph, sceneGraphDatabase.instanceNodes),
+    }
+    with open(path, 'wb') as f:
+        pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_compiled(path):
+    """
+    OUTPUT:
+        the SceneGraphDatabase stored by save_compiled
+    """
+    with open(path, 'rb') as f:
+        compiled = pickle.load(f)
+    if isinstance(compiled, SceneGraphDatabase):
+        # Compiled before the flat format
+        return compiled
+    sceneGraphDatabase = SceneGraphDatabase()
+    sceneGraphDatabase.__dict__.update(compiled["state"])
+    nodes = []
+    for parentRow, fields, _ in compiled["nodes"]:
+        node = Node.__new__(Node)
+        node.__dict__.update(fields)
+        node.partNodes = {}
+        nodes.append(node)
+        if parentRow < 0:
+            sceneGraphDatabase.instanceNodes[node.nodeID] = node
+        else:
+            nodes[parentRow].partNodes[node.nodeID] = node
+    # Part graphs refer to the children, so they are restored once every node exists
+    for node, (_, _, graphRows) in zip(nodes, compiled["nodes"]):
+        selfNodes = dict(node.partNodes)
+        selfNodes.setdefault(node.nodeID, node)
+        node.partGraph = _restore_graph(graphRows, selfNodes)
+    sceneGraphDatabase.instancesGraph = _restore_graph(compiled["instancesGraph"], sceneGraphDatabase.instanceNodes)
+    return sceneGraphDatabase
 
 class SceneGraphDatabase:
     def __init__(self, sceneGraph=None):
@@ -147,20 +266,97 @@ class SceneGraphDatabase:
         ATTRIBUTES:
             instancesGraph: an nx.MultiDiGraph. Nodes will be instances in the scene graph; Edges will be instance level relations
             instanceNodes: a dict. Stores all the instance-level objectsd. Helps in LLM pruning for task planning
+            revision: int, bumped by every applied patch
+            changeListeners: list of callables notified with the affected instance ids (None for all) after each patch
+            sourcePath: path of the scene graph JSON file the database was streamed from, "" otherwise
+            kinematicOverlay: dict. Key: tuple of ids from the instance down to the owner node; Value: {"added": list of
+                JSON kinematic relations, "removed": set of (subject, object)}. Kinematic relations are only read from the
+                scene graph JSON when they are needed (AddKinematicRelations), so patches are kept here and applied then
         """
         self.instancesGraph = nx.MultiDiGraph()
         self.instanceNodes = {}
+        self.revision = 0
+        self.changeListeners = []
+        self.sourcePath = ""
+        self.kinematicOverlay = {}
         if sceneGraph:
             self.load_from_scene_graph(sceneGraph, 1)
+
+    def __getstate__(self):
+        # Listeners belong to the process that registered them and are usually not picklable
+        state = self.__dict__.copy()
+        state["changeListeners"] = []
+        return state
+
+    def __setstate__(self, state):
+        # Databases compiled before patches had an overlay
+        state.setdefault("kinematicOverlay", {})
+        self.__dict__.update(state)
             
     def add_kinematic_relations(self, sceneGraph, keptSG):
         for instanceID in keptSG:
             for instance in sceneGraph.get("objects", []):
                 if instance.get("id") == instanceID:
                     instanceNode = self.instanceNodes[instanceID]
-                    recursive_tree_constructor_add_kinematic(instance,instanceNode)
+                    recursive_tree_constructor_add_kinematic(instance,instanceNode, self.instance_overlay(instanceID))
             
     
+    def add_kinematic_relations_from_stream(self, sgPath, keptSG):
+        """
+        INPUTS:
+            sgPath: path to the scene graph JSON file with kinematic relations
+            keptSG: list of kept instance ids
+        EFFECTS:
+            Same as add_kinematic_relations, but streams the file and only keeps one instance in memory at a time
+        """
+        keptIDs = set(keptSG)
+        for instance in iter_scene_objects(sgPath, skipUnusedFields=True):
+            instanceID = instance.get("id")
+            if instanceID in keptIDs:
+                recursive_tree_constructor_add_kinematic(instance, self.instanceNodes[instanceID], self.instance_overlay(instanceID))
+
+    def instance_overlay(self, instanceID) -> dict:
+        """
+        OUTPUT:
+            the entries of kinematicOverlay under one instance
+        """
+        return {path: patched for path, patched in self.kinematicOverlay.items() if path[0] == instanceID}
+
+    def _drop_overlay(self, path):
+        # Forget the patched kinematic relations of a removed subtree
+        path = tuple(path)
+        for ownerPath in [ownerPath for ownerPath in self.kinematicOverlay if ownerPath[:len(path)] == path]:
+            del self.kinematicOverlay[ownerPath]
+
+    def load_from_stream(self, sgPath, mode=1, skipUnusedFields=True):
+        """
+        INPUT:
+            sgPath: path to the scene graph JSON file
+            mode: same as load_from_scene_graph
+            skipUnusedFields: drop the fields the pipeline never reads before constructing the nodes
+        EFFECTS:
+            Construct the objects graph while the file is parsed: each "objects" entry is turned into a Node and
+            discarded right away, so the raw scene graph dict is never held in memory next to the node tree.
+        """
+        constructor = recursive_tree_constructor_with_kinematic if mode == 0 else recursive_tree_constructor_without_kinematic
+        self.sourcePath = sgPath
+        relationships = []
+        for key, item in iter_scene_items(sgPath, skipUnusedFields=skipUnusedFields):
+            if key == "objects":
+                instanceNode = constructor(item, "")
+                instanceID = instanceNode.nodeID
+                self.instanceNodes[instanceID] = instanceNode
+                self.instancesGraph.add_node(instanceID, node=instanceNode)
+            else:
+                relationships.append(item)
+        # Relations are added after every instance, as in load_from_scene_graph
+        for relationship in relationships:
+            self.instancesGraph.add_edge(
+                relationship.get("subject", ""),
+                relationship.get("object", ""),
+                predicate=relationship.get("predicate", "")
+            )
+
     def load_from_scene_graph(self, sceneGraph, mode):
         """
         INPUT: 
@@ -185,4 +381,230 @@ class SceneGraphDatabase:
                 subject = relationship.get("subject", "")
                 object = relationship.get("object", "")
                 predicate = relationship.get("predicate", "")
-                self.instancesGraph.add_edge(subject, object, predicate=predicate)
\ No newline at end of file
+                self.instancesGraph.add_edge(subject, object, predicate=predicate)
+
+    def add_change_listener(self, listener):
+        """
+        INPUT:
+            listener: callable taking a set of affected instance ids, or None when every instance may be affected
+        EFFECTS:
+            Register a derived cache (prompt fragments, prune memos, ...) to be invalidated after each patch
+        """
+        self.changeListeners.append(listener)
+
+    def find_node(self, path) -> Node:
+        """
+        INPUT:
+            path: list of ids from the instance down to the wanted node, e.g. [instanceID, partID, subpartID]
+        OUTPUT:
+            the Node at the end of the path; raises KeyError if any id is missing
+        """
+        node = self.instanceNodes[path[0]]
+        for partID in path[1:]:
+            node = node.partNodes[partID]
+        return node
+
+    def _touch(self, path):
+        """
+        EFFECTS:
+            Bump the version and refresh the subtree kinematic count of every node along the path, since the subtree of each of them changed
+        """
+        nodes = [self.instanceNodes[path[0]]]
+        for partID in path[1:]:
+            nodes.append(nodes[-1].partNodes[partID])
+        for node in reversed(nodes):
+            node.version += 1
+            node.subtreeKinematicCount = node.kinematicCount + sum(partNode.subtreeKinematicCount for partNode in node.partNodes.values())
+
+    def add_instance(self, instance) -> Node:
+        """
+        INPUT:
+            instance: JSON format description of the instance, as in the "objects" list of the scene graph
+        """
+        instanceNode = recursive_tree_constructor_without_kinematic(instance, "")
+        instanceID = instanceNode.nodeID
+        self.instanceNodes[instanceID] = instanceNode
+        self.instancesGraph.add_node(instanceID, node=instanceNode)
+        return instanceNode
+
+    def remove_instance(self, instanceID):
+        """
+        EFFECTS:
+            Remove the instance, its part tree and every instance level relation touching it
+        """
+        del self.instanceNodes[instanceID]
+        self._drop_overlay([instanceID])
+        if self.instancesGraph.has_node(instanceID):
+            self.instancesGraph.remove_node(instanceID)
+
+    def update_node(self, path, fields):
+        """
+        INPUTS:
+            path: list of ids from the instance down to the node
+            fields: dict, any of "name" (node type) and "description"
+        """
+        node = self.find_node(path)
+        if "name" in fields:
+            node.nodeType = fields["name"]
+        if "description" in fields:
+            node.description = fields["description"]
+        self._touch(path)
+
+    def add_part(self, ownerPath, part) -> Node:
+        """
+        INPUTS:
+            ownerPath: list of ids from the instance down to the owner of the new part
+            part: JSON format description of the part, as in the "children" list of the scene graph
+        """
+        owner = self.find_node(ownerPath)
+        partNode = recursive_tree_constructor_without_kinematic(part, owner.nodeID)
+        owner.partNodes[partNode.nodeID] = partNode
+        self._touch(ownerPath)
+        return partNode
+
+    def remove_part(self, path):
+        """
+        INPUT:
+            path: list of ids from the instance down to the part to remove
+        EFFECTS:
+            Remove the part with its subtree, its kinematic relations and its entry in the owner's keptSG
+        """
+        owner = self.find_node(path[:-1])
+        partID = path[-1]
+        del owner.partNodes[partID]
+        self._drop_overlay(path)
+        if partID in owner.keptSG:
+            owner.keptSG.remove(partID)
+        if owner.partGraph.has_node(partID):
+            owner.partGraph.remove_node(partID)
+        self._touch(path[:-1])
+
+    def add_relationship(self, subject, object, predicate):
+        self.instancesGraph.add_edge(subject, object, predicate=predicate)
+
+    def remove_relationship(self, subject, object, predicate=None):
+        """
+        EFFECTS:
+            Remove the instance level relations from subject to object; only those with the given predicate if it is set
+        """
+        if not self.instancesGraph.has_edge(subject, object):
+            return
+        edgeKeys = [
+            key for key, data in self.instancesGraph[subject][object].items()
+            if predicate is None or data.get("predicate") == predicate
+        ]
+        for key in edgeKeys:
+            self.instancesGraph.remove_edge(subject, object, key)
+
+    def add_kinematic_relation(self, ownerPath, kinematicRelation):
+        """
+        INPUTS:
+            ownerPath: list of ids from the instance down to the node owning both parts of the relation
+            kinematicRelation: JSON format description of the kinematic relation
+        EFFECTS:
+            Record the relation in kinematicOverlay, so it is added with the relations of the JSON, and add it to partGraph
+            right away if both parts are already kept (the kinematic relations of the kept tree were already added)
+        """
+        owner = self.find_node(ownerPath)
+        subject = kinematicRelation.get("subject")
+        object = kinematicRelation.get("object")
+        if subject in owner.partNodes and object in owner.partNodes:
+            patched = self.kinematicOverlay.setdefault(tuple(ownerPath), {"added": [], "removed": set()})
+            patched["added"].append(kinematicRelation)
+            patched["removed"].discard((subject, object))
+            owner.kinematicCount += 1
+            if subject in owner.keptSG and object in owner.keptSG and not owner.partGraph.has_edge(subject, object):
+                add_kinematic_edge(owner.partGraph, kinematicRelation)
+        self._touch(ownerPath)
+
+    def remove_kinematic_relation(self, ownerPath, subject, object):
+        """
+        EFFECTS:
+            Remove the relation from partGraph if it was already added, and record it in kinematicOverlay so it is not
+            read back from the JSON later
+        """
+        owner = self.find_node(ownerPath)
+        patched = self.kinematicOverlay.setdefault(tuple(ownerPath), {"added": [], "removed": set()})
+        patched["added"] = [
+            kinematicRelation for kinematicRelation in patched["added"]
+            if (kinematicRelation.get("subject"), kinematicRelation.get("object")) != (subject, object)
+        ]
+        patched["removed"].add((subject, object))
+        while owner.partGraph.has_edge(subject, object):
+            owner.partGraph.remove_edge(subject, object)
+        # The relation may only exist in the JSON, so the count drops even when partGraph held no edge
+        owner.kinematicCount = max(owner.kinematicCount - 1, 0)
+        self._touch(ownerPath)
+
+    def apply_patch(self, patch):
+        """
+        INPUT:
+            patch: list of operations, each a dict with an "op" key:
+                {"op": "add_instance", "instance": {...}}
+                {"op": "remove_instance", "id": instanceID}
+                {"op": "update_instance", "id": instanceID, "fields": {"name": ..., "description": ...}}
+                {"op": "add_part", "owner": [instanceID, ...], "part": {...}}
+                {"op": "remove_part", "path": [instanceID, ..., partID]}
+                {"op": "update_part", "path": [instanceID, ..., partID], "fields": {...}}
+                {"op": "add_relationship", "subject": ..., "object": ..., "predicate": ...}
+                {"op": "remove_relationship", "subject": ..., "object": ..., "predicate": ... (optional)}
+                {"op": "add_kinematic_relation", "owner": [instanceID, ...], "relation": {...}}
+                {"op": "remove_kinematic_relation", "owner": [instanceID, ...], "subject": ..., "object": ...}
+        EFFECTS:
+            Apply the operations in place and notify the change listeners once with the affected instance ids.
+            Adding or renaming an instance changes the instance level candidates of every task, so it affects all instances.
+            If an operation raises, the operations before it stay applied, so the revision is still bumped and the
+            listeners are told every instance may be affected before the error propagates
+        OUTPUT:
+            set of affected instance ids, or None if every instance is affected
+        """
+        affected = None
+        try:
+            affected = self._apply_operations(patch)
+        finally:
+            self.revision += 1
+            for listener in self.changeListeners:
+                listener(affected)
+        return affected
+
+    def _apply_operations(self, patch):
+        affected = set()
+        for operation in patch:
+            op = operation["op"]
+            if op == "add_instance":
+                self.add_instance(operation["instance"])
+                touched = None
+            elif op == "remove_instance":
+                self.remove_instance(operation["id"])
+                touched = {operation["id"]}
+            elif op == "update_instance":
+                self.update_node([operation["id"]], operation.get("fields", {}))
+                touched = None
+            elif op == "add_part":
+                self.add_part(operation["owner"], operation["part"])
+                touched = {operation["owner"][0]}
+            elif op == "remove_part":
+                self.remove_part(operation["path"])
+                touched = {operation["path"][0]}
+            elif op == "update_part":
+                self.update_node(operation["path"], operation.get("fields", {}))
+                touched = {operation["path"][0]}
+            elif op == "add_relationship":
+                self.add_relationship(operation["subject"], operation["object"], operation.get("predicate", ""))
+                touched = {operation["subject"], operation["object"]}
+            elif op == "remove_relationship":
+                self.remove_relationship(operation["subject"], operation["object"], operation.get("predicate"))
+                touched = {operation["subject"], operation["object"]}
+            elif op == "add_kinematic_relation":
+                self.add_kinematic_relation(operation["owner"], operation["relation"])
+                touched = {operation["owner"][0]}
+            elif op == "remove_kinematic_relation":
+                self.remove_kinematic_relation(operation["owner"], operation["subject"], operation["object"])
+                touched = {operation["owner"][0]}
+            else:
+                raise ValueError(f"Unknown scene graph patch operation: {op}")
+            if touched is None or affected is None:
+                affected = None
+            else:
+                affected |= touched
+        return affected
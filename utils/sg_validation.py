@@ -0,0 +1,166 @@
+import numpy as np
+from utils.sg_stream import iter_scene_items
+from utils.traversal import walk, iter_nodes, json_children
+
+
+class SceneArrays:
+    """
+    EFFECTS:
+        Flattened view of one scene graph: every instance/part is one row of the node arrays, every relation one row of
+        the relation arrays, so checks and statistics run as NumPy operations instead of Python tree walks.
+        Fill it with add_object/add_relationship (scene JSON) or from_database (built SceneGraphDatabase), then finish()
+    ATTRIBUTES:
+        ids: array of str, id of each node in pre-order
+        parents: int array, row of the parent of each node; -1 for instances
+        depths: int array, 0 for instances, 1 for their parts, ...
+        relSubjects, relObjects: arrays of str, instance-level relationships
+        kinOwners: int array, row of the node whose kinematic_relations list holds each kinematic relation
+        kinSubjects, kinObjects: arrays of str, the parts named by each kinematic relation
+    """
+    def __init__(self):
+        self._ids = []
+        self._parents = []
+        self._depths = []
+        self._relSubjects = []
+        self._relObjects = []
+        self._kinOwners = []
+        self._kinSubjects = []
+        self._kinObjects = []
+
+    def add_object(self, instance):
+        """
+        INPUT:
+            instance: JSON format description of an instance (an "objects" entry), with or without kinematic relations
+        """
+        rows = {}
+        for part, parent, depth in walk([instance], json_children):
+            row = len(self._ids)
+            rows[id(part)] = row
+            self._ids.append(str(part.get("id", "")))
+            self._parents.append(-1 if parent is None else rows[id(parent)])
+            self._depths.append(depth)
+            for kinematicRelation in part.get("kinematic_relations", []):
+                self._kinOwners.append(row)
+                self._kinSubjects.append(str(kinematicRelation.get("subject", "")))
+                self._kinObjects.append(str(kinematicRelation.get("object", "")))
+
+    def add_relationship(self, relationship):
+        self._relSubjects.append(str(relationship.get("subject", "")))
+        self._relObjects.append(str(relationship.get("object", "")))
+
+    @classmethod
+    def from_database(cls, sceneGraphDatabase):
+        """
+        OUTPUT:
+            finished SceneArrays of a built database. Only the kinematic relations already added to the part graphs are
+            included, and ids duplicated under one owner were already merged by the constructors
+        """
+        arrays = cls()
+        rows = {}
+        for node, parent, depth in iter_nodes(sceneGraphDatabase.instanceNodes.values()):
+            row = len(arrays._ids)
+            rows[id(node)] = row
+            arrays._ids.append(node.nodeID)
+            arrays._parents.append(-1 if parent is None else rows[id(parent)])
+            arrays._depths.append(depth)
+            for subject, object in node.partGraph.edges():
+                arrays._kinOwners.append(row)
+                arrays._kinSubjects.append(str(subject))
+                arrays._kinObjects.append(str(object))
+        for subject, object in sceneGraphDatabase.instancesGraph.edges():
+            arrays._relSubjects.append(str(subject))
+            arrays._relObjects.append(str(object))
+        return arrays.finish()
+
+    def finish(self):
+        self.ids = np.array(self._ids, dtype=str)
+        self.parents = np.array(self._parents, dtype=np.int64)
+        self.depths = np.array(self._depths, dtype=np.int64)
+        self.relSubjects = np.array(self._relSubjects, dtype=str)
+        self.relObjects = np.array(self._relObjects, dtype=str)
+        self.kinOwners = np.array(self._kinOwners, dtype=np.int64)
+        self.kinSubjects = np.array(self._kinSubjects, dtype=str)
+        self.kinObjects = np.array(self._kinObjects, dtype=str)
+        return self
+
+
+def scene_arrays_from_json(sgPath: str) -> SceneArrays:
+    """
+    OUTPUT:
+        finished SceneArrays of a scene graph JSON file, streamed one instance at a time
+    """
+    arrays = SceneArrays()
+    for key, item in iter_scene_items(sgPath, skipUnusedFields=True):
+        if key == "objects":
+            arrays.add_object(item)
+        else:
+            arrays.add_relationship(item)
+    return arrays.finish()
+
+
+def validate_scene_arrays(arrays: SceneArrays) -> list:
+    """
+    OUTPUT:
+        list of error strings: duplicate ids, relationships whose subject/object is not an instance, and kinematic
+        relations whose subject/object is not a part of the node holding them (dropped silently by the constructors)
+    """
+    errors = []
+    uniqueIDs, counts = np.unique(arrays.ids, return_counts=True)
+    errors.extend(f"duplicate id {duplicateID}" for duplicateID in uniqueIDs[counts > 1])
+
+    instanceIDs = arrays.ids[arrays.parents < 0]
+    dangling = ~(np.isin(arrays.relSubjects, instanceIDs) & np.isin(arrays.relObjects, instanceIDs))
+    errors.extend(
+        f"dangling relationship {subject} -> {object}"
+        for subject, object in zip(arrays.relSubjects[dangling], arrays.relObjects[dangling])
+    )
+
+    if len(arrays.kinOwners):
+        # Encode every id as an integer, then (owner row, part id) pairs as one int64 key each
+        allIDs, codes = np.unique(np.concatenate([arrays.ids, arrays.kinSubjects, arrays.kinObjects]), return_inverse=True)
+        nodeCodes, subjectCodes, objectCodes = np.split(codes, [len(arrays.ids), len(arrays.ids) + len(arrays.kinOwners)])
+        base = len(allIDs)
+        isPart = arrays.parents >= 0
+        partKeys = arrays.parents[isPart] * base + nodeCodes[isPart]
+        missing = ~(np.isin(arrays.kinOwners * base + subjectCodes, partKeys)
+                    & np.isin(arrays.kinOwners * base + objectCodes, partKeys))
+        errors.extend(
+            f"kinematic relation {subject} -> {object} of {owner} names a missing part"
+            for owner, subject, object in zip(arrays.ids[arrays.kinOwners[missing]], arrays.kinSubjects[missing], arrays.kinObjects[missing])
+        )
+    return errors
+
+
+def scene_statistics(arrays: SceneArrays) -> dict:
+    """
+    OUTPUT:
+        dict of summary metrics: node counts, fan-out of the nodes with parts, depth histogram (nodes per depth),
+        relation density (relationships per ordered instance pair) and kinematic relations per node with parts
+    """
+    isInstance = arrays.parents < 0
+    instances = int(isInstance.sum())
+    fanOut = np.bincount(arrays.parents[~isInstance], minlength=len(arrays.ids))
+    internalFanOut = fanOut[fanOut > 0]
+    instancePairs = instances * (instances - 1)
+    return {
+        "instances": instances,
+        "parts": int(len(arrays.ids) - instances),
+        "max_depth": int(arrays.depths.max()) if len(arrays.depths) else 0,
+        "depth_histogram": np.bincount(arrays.depths).tolist(),
+        "fan_out_mean": float(internalFanOut.mean()) if len(internalFanOut) else 0.0,
+        "fan_out_max": int(internalFanOut.max()) if len(internalFanOut) else 0,
+        "fan_out_histogram": np.bincount(internalFanOut).tolist(),
+        "relationships": int(len(arrays.relSubjects)),
+        "relation_density": len(arrays.relSubjects) / instancePairs if instancePairs else 0.0,
+        "kinematic_relations": int(len(arrays.kinOwners)),
+        "kinematic_per_internal_node": len(arrays.kinOwners) / len(internalFanOut) if len(internalFanOut) else 0.0,
+    }
+
+
+def validate_scene(sgPath: str) -> dict:
+    """
+    OUTPUT:
+        {"errors": list of str, "stats": scene_statistics} of a scene graph JSON file
+    """
+    arrays = scene_arrays_from_json(sgPath)
+    return {"errors": validate_scene_arrays(arrays), "stats": scene_statistics(arrays)}
@@ -0,0 +1,75 @@
+PRE_ORDER = "pre"
+POST_ORDER = "post"
+
+
+def part_children(node):
+    """
+    OUTPUT:
+        all the parts of a Node
+    """
+    return node.partNodes.values()
+
+
+def kept_children(node):
+    """
+    OUTPUT:
+        the kept parts of a Node, in keptSG order
+    """
+    return [node.partNodes[partID] for partID in node.keptSG]
+
+
+def json_children(part):
+    """
+    OUTPUT:
+        the "children" entries of a JSON format instance/part
+    """
+    return part.get("children", [])
+
+
+def walk(roots, children, order: str = PRE_ORDER):
+    """
+    INPUTS:
+        roots: iterable of root items (Nodes, JSON dicts, or any tree items)
+        children: callable item -> iterable of child items. In pre-order it is called exactly once per item, when the
+            item is visited, so it may compute the children on the fly (e.g. ask the LLM which parts to keep)
+        order: PRE_ORDER (parents before children) or POST_ORDER (children before parents)
+    EFFECTS:
+        Depth-first traversal with an explicit stack, so deep part hierarchies never hit the recursion limit.
+        Siblings are visited in the order returned by children, matching the recursive walks it replaces
+    OUTPUT:
+        generator of (item, parent, depth); parent is None for the roots
+    """
+    roots = list(roots)
+    if order == PRE_ORDER:
+        stack = [(root, None, 0) for root in reversed(roots)]
+        while stack:
+            item, parent, depth = stack.pop()
+            yield item, parent, depth
+            childList = list(children(item))
+            for child in reversed(childList):
+                stack.append((child, item, depth + 1))
+    elif order == POST_ORDER:
+        stack = [(root, None, 0, False) for root in reversed(roots)]
+        while stack:
+            item, parent, depth, expanded = stack.pop()
+            if expanded:
+                yield item, parent, depth
+                continue
+            stack.append((item, parent, depth, True))
+            childList = list(children(item))
+            for child in reversed(childList):
+                stack.append((child, item, depth + 1, False))
+    else:
+        raise ValueError(f"Unknown traversal order: {order}")
+
+
+def iter_nodes(roots, order: str = PRE_ORDER, keptOnly: bool = False):
+    """
+    INPUTS:
+        roots: iterable of Nodes
+        order: PRE_ORDER or POST_ORDER
+        keptOnly: only descend into the parts listed in each node's keptSG
+    OUTPUT:
+        generator of (node, parentNode, depth)
+    """
+    return walk(roots, kept_children if keptOnly else part_children, order)